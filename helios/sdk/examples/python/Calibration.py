@@ -0,0 +1,41 @@
+import numpy as np
+
+
+CHANNELS = ('r', 'g', 'b', 'i')
+
+
+class ColorCalibration:
+    """ Per-DAC color correction: a 256 entry lookup table for each of r, g, b and i.
+
+        min_visible is the lowest level at which a diode still lases, one value or one per r, g, b.
+        Every non-zero input is raised to at least that level, so dim colors don't vanish.
+        Channels without a table pass through unchanged.
+    """
+    def __init__(self, r=None, g=None, b=None, i=None, min_visible=0):
+        identity = np.arange(256)
+        luts = np.stack([identity if lut is None else np.asarray(lut) for lut in (r, g, b, i)])
+        if luts.shape != (4, 256):
+            raise ValueError('Calibration tables must have 256 entries')
+        min_visible = np.broadcast_to(np.asarray(min_visible), (3,)).reshape(3, 1)
+        luts[:3, 1:] = np.maximum(luts[:3, 1:], min_visible)
+        self.luts = np.clip(luts, 0, 255).astype(np.uint8)
+        # All four tables back to back, so a frame is corrected with a single gather
+        self._flat = self.luts.reshape(-1)
+        self._channel_offset = np.arange(4) * 256
+
+    @classmethod
+    def from_gamma(cls, gamma=2.2, gain=(1.0, 1.0, 1.0), min_visible=0, intensity=False):
+        """ Gamma curve per color channel scaled by gain (e.g. to balance diode power).
+            The intensity channel is corrected too if intensity is True. """
+        levels = np.arange(256) / 255
+        curves = [np.rint(255 * g * levels**gamma) for g in np.broadcast_to(gain, (3,))]
+        return cls(*curves, i=np.rint(255 * levels**gamma) if intensity else None, min_visible=min_visible)
+
+    def apply(self, points):
+        """ Correct a HELIOS_POINT_DTYPE array in place. """
+        if len(points) == 0:
+            return points
+        # r, g, b and i are the last four bytes of each 8 byte point
+        colors = points.view(np.uint8).reshape(-1, points.dtype.itemsize)[:, 4:8]
+        colors[...] = self._flat[colors + self._channel_offset]
+        return points
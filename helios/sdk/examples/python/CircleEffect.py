@@ -6,6 +6,7 @@ Created on Fri May 10 20:52:34 2024
 """
 from LaserCore import HeliosPoint, Frame, LaserCore
 from LaserEffects import LaserEffect
+from PathCompiler import Polyline
 
 import numpy as np
 import pyaudio
@@ -79,52 +80,15 @@ class DynamicCircleEffect(LaserEffect):
             self.circle_entry_angle += self.circle_entry_rate
             x = int(self.center_x + self.radius * math.cos(angle))
             y = int(self.center_y + self.radius * math.sin(angle))
-            x = max(0, min(self.max_x, x))
-            y = max(0, min(self.max_y, y))
             self.points.append({'pos': (x, y), 'color': self.point_color})
 
     def update_frame(self, frame, clear):
         if clear:
             frame.clear()
         
-        start_blank_point = HeliosPoint(self.points[0]['pos'][0], self.points[0]['pos'][1], 0, 0, 0)
-        frame.move_head_to_point(start_blank_point, self.min_step_size)
-        
-        
-        for _ in range(self.starting_blanking_points):
-            frame.add_point(start_blank_point)
-            
-        for i in range(self.num_points+1): #+1 for wrap around
-            
-            current_point = self.points[i % self.num_points]
-            next_point = self.points[(i + 1) % self.num_points]  # wrap around to the start
-            start_point = HeliosPoint(current_point['pos'][0], current_point['pos'][1], self.point_color[0], self.point_color[1], self.point_color[2])
-            end_point = HeliosPoint(next_point['pos'][0], next_point['pos'][1], self.line_color[0], self.line_color[1], self.line_color[2])
-            start_blank_point = HeliosPoint(current_point['pos'][0], current_point['pos'][1], 0, 0, 0)
-            end_blank_point = HeliosPoint(next_point['pos'][0], next_point['pos'][1], 0, 0, 0)
-            
-            
-            for _ in range(self.blanking_points):
-                frame.add_point(start_blank_point)
-            
-            for _ in range(self.brightness_multiplier):
-                frame.add_point(start_point)
-                
-            frame.add_line_smooth(start_point, end_point, color=self.line_color, min_step_size=self.min_step_size, max_step_size=self.max_step_size, transition_length=self.transition_length)
-            
-            for _ in range(self.blanking_points):
-                frame.add_point(end_blank_point)
-                
-                
-        # for _ in range(self.starting_blanking_points):
-        #     frame.add_point(end_blank_point)
-                
-    
-                
-        
-            
-       
-
+        circle = Polyline([point['pos'] for point in self.points], self.point_color, self.line_color, closed=True)
+        # Parts of the circle past the edge are cut off instead of flattened onto it
+        self.draw_paths(frame, self.clip_paths([circle]))
             
             
 #%%
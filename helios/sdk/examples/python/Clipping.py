@@ -0,0 +1,134 @@
+import numpy as np
+
+from PathCompiler import Polyline
+
+
+def viewport(max_x=0xFFF, max_y=0xFFF):
+    """ The full drawable area as a clip rectangle (x_min, y_min, x_max, y_max). """
+    return (0, 0, max_x, max_y)
+
+
+def _clip_parameters(starts, ends, rect):
+    """ Liang-Barsky for a batch of segments: the visible part of segment k runs from
+        t0[k] to t1[k] along it, and visible[k] is False when nothing of it is inside rect. """
+    d = ends - starts
+    x_min, y_min, x_max, y_max = rect
+    # One column per edge: left, right, bottom, top
+    p = np.stack([-d[:, 0], d[:, 0], -d[:, 1], d[:, 1]], axis=1)
+    q = np.stack([starts[:, 0] - x_min, x_max - starts[:, 0], starts[:, 1] - y_min, y_max - starts[:, 1]], axis=1)
+    parallel = p == 0
+    r = q / np.where(parallel, 1, p)
+    t0 = np.max(np.where(p < 0, r, 0), axis=1)
+    t1 = np.min(np.where(p > 0, r, 1), axis=1)
+    visible = (t0 <= t1) & ~np.any(parallel & (q < 0), axis=1)
+    return t0, t1, visible
+
+
+def clip_to_planes(starts, ends, planes):
+    """ Liang-Barsky against any convex set of half-spaces, in any dimension.
+
+        planes is a (P, D+1) array; a point p of dimension D is inside when
+        planes[:, :D] @ p + planes[:, D] >= 0 for every plane. For a batch of segments, returns
+        t0, t1 and visible like the rectangle case: the part from t0 to t1 along each segment is inside.
+    """
+    planes = np.asarray(planes, dtype=np.float64)
+    d0 = starts @ planes[:, :-1].T + planes[:, -1]
+    d1 = ends @ planes[:, :-1].T + planes[:, -1]
+    denom = d0 - d1
+    t = d0 / np.where(denom == 0, 1, denom)
+    t0 = np.max(np.where((d0 < 0) & (d1 >= 0), t, 0), axis=1)
+    t1 = np.min(np.where((d1 < 0) & (d0 >= 0), t, 1), axis=1)
+    visible = (t0 <= t1) & ~np.any((d0 < 0) & (d1 < 0), axis=1)
+    return t0, t1, visible
+
+
+def clip_segments(starts, ends, rect=viewport()):
+    """ Clip (N,2) arrays of segment starts and ends to rect = (x_min, y_min, x_max, y_max).
+        Returns the clipped starts and ends plus a mask of the segments that are at least partly
+        inside; the positions of the others are meaningless. """
+    starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+    t0, t1, visible = _clip_parameters(starts, ends, rect)
+    d = ends - starts
+    low, high = np.array(rect[:2]), np.array(rect[2:])
+    # Rounding can put an intersection a hair outside
+    clipped_starts = np.clip(starts + t0[:, None] * d, low, high)
+    clipped_ends = np.clip(starts + t1[:, None] * d, low, high)
+    return clipped_starts, clipped_ends, visible
+
+
+def _rows(values, count, width=None):
+    """ values with one row per vertex or segment, or None when given once for the whole polyline. """
+    if values is None:
+        return None
+    values = np.asarray(values).reshape((-1,) if width is None else (-1, width))
+    return values if len(values) == count else None
+
+
+def clip_polylines(polylines, rect=viewport()):
+    """ Clip Polylines to rect, splitting them wherever they leave it.
+
+        Every segment of every polyline is clipped in one batch. Runs of segments that stay
+        joined inside the rectangle become one open Polyline; a closed polyline that is entirely
+        inside is returned as it is. Vertices created on the border get no dwell when the
+        dwell is given per vertex. Dots outside the rectangle are dropped.
+    """
+    polylines = [line for line in polylines if len(line.points) > 0]
+    if not polylines:
+        return []
+    sizes = np.array([len(line.points) for line in polylines])
+    closed = np.array([line.closed and len(line.points) > 1 for line in polylines])
+    num_segments = np.where(sizes == 1, 0, np.where(closed, sizes, sizes - 1))
+    starts = np.concatenate([line.points[:m] for line, m in zip(polylines, num_segments)])
+    ends = np.concatenate([np.roll(line.points, -1, axis=0)[:m] for line, m in zip(polylines, num_segments)])
+    t0, t1, visible = _clip_parameters(starts, ends, rect)
+    d = ends - starts
+    low, high = np.array(rect[:2]), np.array(rect[2:])
+    clipped_starts = np.clip(starts + t0[:, None] * d, low, high)
+    clipped_ends = np.clip(starts + t1[:, None] * d, low, high)
+    # Segment k carries straight on into the next one only if neither was cut at the shared vertex
+    whole_end = visible & (t1 >= 1)
+    whole_start = visible & (t0 <= 0)
+
+    result = []
+    first_segment = np.cumsum(num_segments) - num_segments
+    for line, n, m, a, is_closed in zip(polylines, sizes, num_segments, first_segment, closed):
+        if m == 0:
+            x, y = line.points[0]
+            if rect[0] <= x <= rect[2] and rect[1] <= y <= rect[3]:
+                result.append(line)
+            continue
+        segments = np.arange(a, a + m)
+        following = np.roll(segments, -1) if is_closed else segments[1:]
+        joined = whole_end[segments[:len(following)]] & whole_start[following]
+        if is_closed:
+            if joined.all():
+                result.append(line)
+                continue
+            # Start right after a break so no run wraps around the end
+            order = (np.argmin(joined) + 1 + np.arange(m)) % m
+            joined = joined[order][:-1]
+        else:
+            order = np.arange(m)
+        runs = np.split(order, np.flatnonzero(~joined) + 1)
+
+        point_color = _rows(line.point_color, n, 4)
+        dwell = _rows(line.dwell, n)
+        line_color = _rows(line.line_color, m, 4)
+        end_color = _rows(line.end_color, m, 4)
+        end_dwell = _rows(line.end_dwell, m)
+        for run in runs:
+            if not visible[a + run[0]]:
+                continue
+            points = np.concatenate([clipped_starts[a + run[:1]], clipped_ends[a + run]])
+            # The original vertex each new vertex sits on, or next to when it lies on the border
+            source = np.concatenate([run[:1], (run + 1) % n])
+            on_border = np.concatenate([t0[a + run[:1]] > 0, t1[a + run] < 1])
+            result.append(Polyline(
+                points,
+                line.point_color if point_color is None else point_color[source],
+                line.line_color if line_color is None else line_color[run],
+                line.dwell if dwell is None else np.where(on_border, 0, dwell[source]),
+                line.end_dwell if end_dwell is None else end_dwell[run],
+                line.end_color if end_color is None else end_color[run]))
+    return result
@@ -0,0 +1,48 @@
+import numpy as np
+
+
+class DwellPlanner:
+    """ Chooses how many points to hold at each vertex from how sharply the path turns there.
+
+        The turning angle is 0 where the path runs straight on and pi where it doubles back.
+        Interior vertices turning less than straight_angle get min_dwell, sharper ones ramp up to
+        max_dwell at a full reversal, shaped by exponent. Path ends (and dots) get end_dwell.
+        max_dwell and end_dwell default to the compiler's brightness_multiplier.
+
+        PathCompiler also drops the blanking at interior vertices, since the beam draws
+        straight through them.
+    """
+    def __init__(self, max_dwell=None, min_dwell=0, end_dwell=None, straight_angle=np.radians(10), exponent=1.0):
+        self.max_dwell = max_dwell
+        self.min_dwell = min_dwell
+        self.end_dwell = end_dwell
+        self.straight_angle = straight_angle
+        self.exponent = exponent
+
+    def corner_dwell(self, angles, max_dwell):
+        """ Dwell points for interior vertices turning by angles (radians). """
+        t = np.clip((angles - self.straight_angle) / (np.pi - self.straight_angle), 0, 1)
+        return np.rint(self.min_dwell + (max_dwell - self.min_dwell) * t**self.exponent).astype(np.int64)
+
+    def plan(self, vertices, sizes, closed, brightness_multiplier):
+        """ Dwell count for every vertex of a batch of paths, plus a mask of the interior vertices.
+            vertices holds the paths' points back to back, sizes and closed describe each path. """
+        max_dwell = brightness_multiplier if self.max_dwell is None else self.max_dwell
+        end_dwell = max_dwell if self.end_dwell is None else self.end_dwell
+        sizes = np.asarray(sizes)
+        offsets = np.cumsum(sizes) - sizes
+        path = np.repeat(np.arange(len(sizes)), sizes)
+        local = np.arange(len(path)) - offsets[path]
+        n = sizes[path]
+        interior = (local > 0) & (local < n - 1) | (np.asarray(closed)[path] & (n > 2))
+
+        incoming = vertices - vertices[offsets[path] + (local - 1) % n]
+        outgoing = vertices[offsets[path] + (local + 1) % n] - vertices
+        lengths = np.hypot(incoming[:, 0], incoming[:, 1]) * np.hypot(outgoing[:, 0], outgoing[:, 1])
+        dot = (incoming * outgoing).sum(axis=1)
+        # A repeated vertex has no direction; treat it as a full corner
+        cos = np.where(lengths > 0, dot / np.where(lengths > 0, lengths, 1), -1)
+        angles = np.arccos(np.clip(cos, -1, 1))
+
+        dwell = np.where(interior, self.corner_dwell(angles, max_dwell), end_dwell)
+        return dwell, interior
@@ -6,6 +6,7 @@ Created on Fri May 10 20:52:34 2024
 """
 from LaserCore import HeliosPoint, Frame, LaserCore
 from LaserEffects import LaserEffect
+from PathCompiler import Polyline
 
 import numpy as np
 import pyaudio
@@ -114,41 +115,11 @@ class FFT(LaserEffect):
         self.update_fft()
         if(clear):
             frame.clear()
-            start_blank_point = HeliosPoint(self.points[0]['pos'][0], self.points[0]['pos'][1], 0, 0, 0, 0)
-            for _ in range(self.starting_blanking_points):
-                frame.add_point(start_blank_point)
         
-        for i in range(self.num_points-1):
-            
-            start = self.points[i]['pos']
-            end = self.points[i + 1]['pos']
-            
-            start_point = HeliosPoint(start[0], start[1], self.point_color[0], self.point_color[1], self.point_color[2])
-            end_point = HeliosPoint(end[0], end[1], 0, 0, 0, 0)
-            start_blank_point = HeliosPoint(start[0], start[1], 0, 0, 0, 0)
-            end_blank_point = HeliosPoint(end[0], end[1], 0, 0, 0, 0)
-                    
-            for _ in range(self.blanking_points):
-                frame.add_point(start_blank_point)
-            
-            for _ in range(self.brightness_multiplier):
-                frame.add_point(start_point)
-        
-            frame.add_line_smooth(start_point, end_point, self.line_color, self.min_step_size, self.max_step_size, self.transition_length)
-            # frame.add_line(start_point, end_point, self.line_color, self.max_step_size)
-            for _ in range(self.brightness_multiplier):
-                frame.add_point(end_point)
-            
-            for _ in range(self.blanking_points):
-                frame.add_point(end_blank_point)
-            
-        # Wrapping around to the first point
-        start = self.points[-1]['pos']
-        end = self.points[0]['pos']        
-        start_blank_point = HeliosPoint(start[0], start[1], 0, 0, 0, 0)
-        end_blank_point = HeliosPoint(end[0], end[1], 0, 0, 0, 0)
-        # frame.add_line_smooth(start_blank_point, end_blank_point, (0,0,0,0), self.min_step_size, self.max_step_size, self.transition_length)
-        frame.add_line(start_point, end_point, self.line_color, self.max_step_size)
+        # Each bar dwells lit at its point and is held dark at the end of every segment
+        spectrum = Polyline([point['pos'] for point in self.points], self.point_color, self.line_color,
+                            end_dwell=self.brightness_multiplier, end_color=(0,0,0,0))
+        self.draw_paths(frame, [spectrum], start_blanking_points=self.starting_blanking_points if clear else 0)
 
             
             
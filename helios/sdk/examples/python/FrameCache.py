@@ -0,0 +1,164 @@
+import itertools
+import zlib
+from collections import OrderedDict
+
+from LaserCore import HeliosPoint, NumpyFrame
+
+
+class FrameStore:
+    """ LRU store of rendered point arrays shared by every PeriodicFrameCache.
+        Least recently used frames are evicted once the total size passes max_bytes. """
+    def __init__(self, max_bytes=64 * 2**20):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.frames = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        points = self.frames.get(key)
+        if points is None:
+            self.misses += 1
+            return None
+        self.frames.move_to_end(key)
+        self.hits += 1
+        return points
+
+    def put(self, key, points):
+        if key in self.frames:
+            self.bytes -= self.frames.pop(key).nbytes
+        self.frames[key] = points
+        self.bytes += points.nbytes
+        while self.bytes > self.max_bytes and self.frames:
+            _, evicted = self.frames.popitem(last=False)
+            self.bytes -= evicted.nbytes
+
+    def discard(self, owner):
+        """ Drop every frame stored for owner. """
+        for key in [key for key in self.frames if key[0] == owner]:
+            self.bytes -= self.frames.pop(key).nbytes
+
+
+# Shared by all caches unless they are given their own store
+default_store = FrameStore()
+
+_cache_ids = itertools.count()
+
+
+class PeriodicFrameCache:
+    """ Wraps an effect whose output repeats every period frames and replays its frames from a FrameStore.
+
+        Call update_frame exactly like the effect's own. Each call is one tick; frame number tick % period
+        is taken from the store when it is there, otherwise the effect renders it and it is stored.
+        The effect's state still has to be advanced as usual (rotations, targets, ...), only the
+        rendering is skipped. Frames are rendered and stored as on a cleared frame; with clear=False
+        a blanked travel from the end of the caller's frame leads into them.
+
+        With period=None the period is detected: every rendered frame is fingerprinted, and once a full
+        period of consecutive frames (and at least confirm) repeats the frames period ticks earlier,
+        that period is used. Effects that have not repeated within max_period frames are rendered
+        every time. Every verify_every ticks a stored frame is rendered anyway and compared; if the
+        effect no longer matches it, the stored frames are dropped and the period found again, so
+        e.g. a paused game that starts moving shows stale frames for at most verify_every - 1 ticks.
+        Call invalidate() after changing the effect's settings.
+    """
+    def __init__(self, effect, period=None, max_period=600, confirm=2, store=None, verify_every=10):
+        self.effect = effect
+        self.period = period
+        self.declared_period = period
+        self.max_period = max_period
+        self.confirm = confirm
+        self.verify_every = verify_every
+        self.store = default_store if store is None else store
+        self.key = next(_cache_ids)
+        self.tick = 0
+        self.scratch = None
+        self._reset_detection()
+
+    def _reset_detection(self):
+        self.fingerprints = []     # Fingerprint of each frame rendered while detecting
+        self.seen = {}             # fingerprint -> ticks it was rendered at
+        self.pending = {}          # tick -> points of the last max_period frames, kept until the period is known
+        self.detecting = self.period is None
+
+    def invalidate(self, period=None):
+        """ Forget the stored frames and start over, optionally with a new declared period. """
+        self.store.discard(self.key)
+        self.period = period
+        self.declared_period = period
+        self.tick = 0
+        self._reset_detection()
+
+    def update_frame(self, frame, clear=True, *args, **kwargs):
+        stored = None
+        if self.period is not None:
+            stored = self.store.get((self.key, self.tick % self.period))
+        verifying = stored is not None and self.verify_every and self.tick % self.verify_every == 0
+
+        if stored is None or verifying:
+            points = self._render(frame.size, *args, **kwargs)
+            if verifying and points.tobytes() != stored.tobytes():
+                # The effect no longer repeats the way it did; start over from this frame
+                self.invalidate(self.declared_period)
+                verifying = False
+            if not verifying:
+                if self.period is not None:
+                    self.store.put((self.key, self.tick % self.period), points)
+                elif self.detecting:
+                    self._detect(points)
+        else:
+            points = stored
+
+        if clear:
+            frame.clear()
+        elif frame.count > 0 and len(points):
+            first = HeliosPoint(int(points['x'][0]), int(points['y'][0]), 0, 0, 0, 0)
+            frame.move_head_to_point(first, min_step_size=getattr(self.effect, 'min_step_size', 10),
+                                     travel_planner=getattr(self.effect, 'travel_planner', None))
+        frame.add_points(points)
+        self.tick += 1
+
+    def _render(self, size, *args, **kwargs):
+        # Always on a cleared frame, so what is stored doesn't depend on what the caller's frame held
+        if self.scratch is None or self.scratch.size != size:
+            self.scratch = NumpyFrame(size)
+        self.effect.update_frame(self.scratch, True, *args, **kwargs)
+        return self.scratch.array[:self.scratch.count].copy()
+
+    def _detect(self, points):
+        fingerprint = (len(points), zlib.crc32(points.tobytes()))
+        t = self.tick
+        self.fingerprints.append(fingerprint)
+        self.pending[t] = points
+        self.pending.pop(t - self.max_period, None)
+        earlier_ticks = self.seen.setdefault(fingerprint, [])
+        for earlier in reversed(earlier_ticks):
+            period = t - earlier
+            # A whole period has to repeat, and at least confirm frames of it, so period p locks after
+            # p + max(confirm, p) frames. With confirm=2 that is three equal frames in a row for period 1
+            needed = max(self.confirm, period)
+            if period > self.max_period or earlier - needed + 1 < 0:
+                break
+            if all(self.fingerprints[t - k] == self.fingerprints[earlier - k] for k in range(1, needed)):
+                self.period = period
+                # Keep the last full cycle, stored under its phase
+                for tick in range(t - period + 1, t + 1):
+                    self.store.put((self.key, tick % period), self.pending[tick])
+                self._stop_detecting()
+                return
+        earlier_ticks.append(t)
+        if t >= 2 * self.max_period + self.confirm:
+            # Not periodic within max_period, stop looking
+            self._stop_detecting()
+
+    def _stop_detecting(self):
+        self.fingerprints = []
+        self.seen = {}
+        self.pending = {}
+        self.detecting = False
+
+    def __getattr__(self, name):
+        # Everything else (shape, settings, ...) comes from the wrapped effect
+        if name == 'effect':
+            raise AttributeError(name)
+        return getattr(self.effect, name)
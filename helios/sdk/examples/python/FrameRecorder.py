@@ -0,0 +1,145 @@
+import os
+import time
+
+import numpy as np
+
+from LaserCore import HELIOS_POINT_DTYPE, as_point_array
+
+
+# A recording is two files: <path> holds the packed points of every frame back to back, and
+# <path>.idx holds a header followed by one INDEX_DTYPE record per frame.
+RECORDING_MAGIC = b'HLRFRAME'
+RECORDING_VERSION = 1
+
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('point_size', '<u4'),
+    ('start', '<f8')        # Wall clock time the recording started
+])
+
+INDEX_DTYPE = np.dtype([
+    ('time', '<f8'),        # Seconds since the recording started
+    ('offset', '<u8'),      # First point of the frame in the data file
+    ('count', '<u4'),
+    ('pps', '<u4'),
+    ('device', '<u4')
+])
+
+
+def index_path(path):
+    return path + '.idx'
+
+
+class FrameRecorder:
+    """ Appends every frame written to the DAC to a recording, with its pps, device and timestamp.
+
+        Frames go straight to the files, so memory use stays the same however long the show runs.
+        Attach one to LaserCore.recorder to capture a live show.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.data = open(path, 'wb')
+        self.index = open(index_path(path), 'wb')
+        self.start = time.perf_counter()
+        self.frames = 0
+        self.points = 0
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header[0] = (RECORDING_MAGIC, RECORDING_VERSION, HELIOS_POINT_DTYPE.itemsize, time.time())
+        self.index.write(header.tobytes())
+
+    def record(self, device_index, frame_rate, points, point_count, timestamp=None):
+        """ Append one frame. points is anything write_frame accepts. """
+        if timestamp is None:
+            timestamp = time.perf_counter() - self.start
+        array = as_point_array(points)[:point_count]
+        entry = np.zeros(1, dtype=INDEX_DTYPE)
+        entry[0] = (timestamp, self.points, len(array), frame_rate, device_index)
+        self.data.write(array.tobytes())
+        self.index.write(entry.tobytes())
+        self.frames += 1
+        self.points += len(array)
+
+    def flush(self):
+        self.data.flush()
+        self.index.flush()
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _map(path, dtype, offset=0):
+    """ Read-only memory map of the records in a file, or an empty array if there are none. """
+    if os.path.getsize(path) <= offset:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset)
+
+
+class FramePlayer:
+    """ Replays a recording from memory-mapped files, with random access to any frame.
+
+        Frames are views into the mapped data, so nothing is loaded until it is sent.
+    """
+    def __init__(self, path):
+        self.path = path
+        header = np.fromfile(index_path(path), dtype=HEADER_DTYPE, count=1)
+        if len(header) == 0 or header[0]['magic'] != RECORDING_MAGIC:
+            raise ValueError(f'{path} is not a frame recording')
+        if header[0]['version'] != RECORDING_VERSION or header[0]['point_size'] != HELIOS_POINT_DTYPE.itemsize:
+            raise ValueError(f'Unsupported recording version {header[0]["version"]}')
+        self.start_time = float(header[0]['start'])
+        self.index = _map(index_path(path), INDEX_DTYPE, HEADER_DTYPE.itemsize)
+        self.points = _map(path, HELIOS_POINT_DTYPE)
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def duration(self):
+        """ Seconds from the first frame until the last one finishes playing. """
+        if len(self.index) == 0:
+            return 0.0
+        last = self.index[-1]
+        return float(last['time'] - self.index[0]['time'] + last['count'] / last['pps'])
+
+    def frame(self, k):
+        """ (points, pps, device) of frame k. points is a read-only view into the recording. """
+        entry = self.index[k]
+        offset = int(entry['offset'])
+        return self.points[offset:offset + int(entry['count'])], int(entry['pps']), int(entry['device'])
+
+    def seek(self, t):
+        """ Index of the frame being shown t seconds into the recording. """
+        times = self.index['time'] - self.index[0]['time']
+        return max(int(np.searchsorted(times, t, side='right')) - 1, 0)
+
+    def play(self, core, start=0.0, speed=1.0, device_index=None, loop=False):
+        """ Send frames to a LaserCore at their recorded timing, starting start seconds in.
+            device_index sends everything to one device instead of the one it was recorded from. """
+        if len(self.index) == 0:
+            return
+        times = self.index['time'] - self.index[0]['time']
+        k = self.seek(start)
+        clock = time.perf_counter() - start / speed
+        while True:
+            for k in range(k, len(self.index)):
+                delay = clock + times[k] / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                points, pps, device = self.frame(k)
+                core.write_frame(device if device_index is None else device_index, pps, points, len(points))
+            if not loop:
+                break
+            clock += self.duration / speed
+            k = 0
+
+    def close(self):
+        # Dropping the maps closes the files
+        self.index = self.points = None
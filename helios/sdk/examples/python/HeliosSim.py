@@ -0,0 +1,189 @@
+import ctypes
+import math
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from LaserCore import (HELIOS_POINT_DTYPE, HELIOS_MAX_POINTS, HELIOS_MAX_RATE, HELIOS_MIN_RATE,
+                       HELIOS_FLAGS_START_IMMEDIATELY, HELIOS_FLAGS_SINGLE_MODE, HELIOS_FLAGS_DONT_BLOCK)
+
+
+# Return codes from HeliosDac.h
+HELIOS_SUCCESS = 1
+HELIOS_ERROR_NOT_INITIALIZED = -1
+HELIOS_ERROR_INVALID_DEVNUM = -2
+HELIOS_ERROR_NULL_POINTS = -3
+HELIOS_ERROR_TOO_MANY_POINTS = -4
+HELIOS_ERROR_PPS_TOO_HIGH = -5
+HELIOS_ERROR_PPS_TOO_LOW = -6
+HELIOS_ERROR_DEVICE_CLOSED = -1000
+HELIOS_ERROR_DEVICE_FRAME_READY = -1001
+
+
+class WrittenFrame:
+    """ One accepted WriteFrame call, as the DAC received it.
+        written, received and started are clock times; started stays None until the frame plays. """
+    def __init__(self, device, written, received, pps, flags, points):
+        self.device = device
+        self.written = written
+        self.received = received
+        self.started = None
+        self.pps = pps
+        self.flags = flags
+        self.points = points
+        self.duration = len(points) / pps
+
+    @property
+    def latency(self):
+        return None if self.started is None else self.started - self.written
+
+
+class _Playback:
+    """ A frame in the DAC's memory and when its current pass started. """
+    def __init__(self, record, start):
+        self.record = record
+        self.start = start
+        self.duration = record.duration
+        self.single = bool(record.flags & HELIOS_FLAGS_SINGLE_MODE)
+
+
+class SimulatedDac:
+    """ State of one simulated DAC: the frame playing, the one-frame buffer behind it and counters. """
+    def __init__(self, index, history):
+        self.index = index
+        self.playing = None
+        self.buffered = None
+        self.transfer_done = 0.0     # When the frame currently on the USB bus arrives
+        self.frames = deque(maxlen=history)
+        self.frames_played = 0
+        self.repeats = 0             # Times a frame was looped because no new one had arrived
+        self.rejected = 0            # WriteFrame calls made while the buffer was still full
+        self.status_polls = 0
+
+    def advance(self, now):
+        """ Move playback forward to now: finish frames, loop them, or start the buffered one. """
+        while self.playing is not None:
+            end = self.playing.start + self.playing.duration
+            if end > now:
+                break
+            if self.buffered is not None and self.buffered.start <= end:
+                self._start(self.buffered, end)
+                self.buffered = None
+            elif self.playing.single:
+                self.playing = None
+            else:
+                # Loop the frame for as many whole repeats as fit before the next frame or now
+                until = now if self.buffered is None else self.buffered.start
+                loops = max(1, math.floor((until - self.playing.start) / self.playing.duration))
+                self.repeats += loops
+                self.playing.start += loops * self.playing.duration
+        if self.playing is None and self.buffered is not None and self.buffered.start <= now:
+            self._start(self.buffered, self.buffered.start)
+            self.buffered = None
+
+    def _start(self, playback, start):
+        playback.start = start
+        playback.record.started = start
+        self.playing = playback
+        self.frames_played += 1
+
+    def ready(self, now):
+        self.advance(now)
+        return self.buffered is None and now >= self.transfer_done
+
+
+class HeliosSim:
+    """ Stand-in for the Helios library with the OpenDevices/GetStatus/WriteFrame/CloseDevices calls LaserCore uses.
+
+        Each DAC plays a frame in points / pps seconds and holds one more frame in its buffer.
+        GetStatus returns 1 while the buffer is free. Frames loop until a new one arrives, unless
+        HELIOS_FLAGS_SINGLE_MODE is set, and HELIOS_FLAGS_START_IMMEDIATELY cuts the playing frame short.
+        WriteFrame takes the USB transfer time for 7 bytes per point, or returns straight away with
+        HELIOS_FLAGS_DONT_BLOCK, like the SDK. It checks pps and devNum, truncates to
+        HELIOS_MAX_POINTS and applies the SDK's workaround for frames of 45 + 64k points.
+        A write while the buffer is full is refused with HELIOS_ERROR_DEVICE_FRAME_READY.
+
+        Every accepted frame is kept in devices[i].frames (the last history frames) as a WrittenFrame
+        with the times it was written, arrived and started playing, so throughput and latency can be measured.
+    """
+    def __init__(self, num_devices=1, usb_bytes_per_second=1000000, history=1000):
+        self.num_devices = num_devices
+        self.usb_bytes_per_second = usb_bytes_per_second
+        self.history = history
+        self.devices = []
+        self.inited = False
+        self.lock = threading.Lock()
+        self.clock = time.perf_counter
+
+    def OpenDevices(self):
+        with self.lock:
+            self.devices = [SimulatedDac(k, self.history) for k in range(self.num_devices)]
+            self.inited = True
+        return self.num_devices
+
+    def CloseDevices(self):
+        with self.lock:
+            self.inited = False
+        return HELIOS_SUCCESS
+
+    def _device(self, devNum):
+        if not self.inited:
+            return HELIOS_ERROR_NOT_INITIALIZED
+        if not 0 <= devNum < len(self.devices):
+            return HELIOS_ERROR_INVALID_DEVNUM
+        return self.devices[devNum]
+
+    def GetStatus(self, devNum):
+        with self.lock:
+            device = self._device(devNum)
+            if isinstance(device, int):
+                return device
+            device.status_polls += 1
+            return 1 if device.ready(self.clock()) else 0
+
+    def WriteFrame(self, devNum, pps, flags, points, numOfPoints):
+        with self.lock:
+            device = self._device(devNum)
+            if isinstance(device, int):
+                return device
+            if not points:
+                return HELIOS_ERROR_NULL_POINTS
+            if pps > HELIOS_MAX_RATE:
+                return HELIOS_ERROR_PPS_TOO_HIGH
+            if pps < HELIOS_MIN_RATE:
+                return HELIOS_ERROR_PPS_TOO_LOW
+
+            now = self.clock()
+            if now < device.transfer_done:
+                # The previous non-blocking transfer is still going
+                return HELIOS_ERROR_DEVICE_FRAME_READY
+            device.advance(now)
+            if device.buffered is not None:
+                device.rejected += 1
+                return HELIOS_ERROR_DEVICE_FRAME_READY
+
+            count = min(numOfPoints, HELIOS_MAX_POINTS)
+            if (count - 45) % 64 == 0:
+                # The SDK drops a point from these sizes and adjusts pps to keep the duration
+                pps = int(pps * (count - 1) / count + 0.5)
+                count -= 1
+            address = ctypes.cast(points, ctypes.c_void_p).value
+            buffer = (ctypes.c_uint8 * (count * HELIOS_POINT_DTYPE.itemsize)).from_address(address)
+            array = np.frombuffer(buffer, dtype=HELIOS_POINT_DTYPE).copy()
+
+            transfer = (count * 7 + 5) / self.usb_bytes_per_second
+            received = now + transfer
+            record = WrittenFrame(devNum, now, received, pps, flags, array)
+            device.frames.append(record)
+            if count > 0:
+                if flags & HELIOS_FLAGS_START_IMMEDIATELY:
+                    # Drop the playing frame; the new one starts as soon as it arrives
+                    device.playing = None
+                device.buffered = _Playback(record, received)
+            device.transfer_done = received
+
+        if not flags & HELIOS_FLAGS_DONT_BLOCK:
+            time.sleep(transfer)
+        return HELIOS_SUCCESS
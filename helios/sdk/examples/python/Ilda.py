@@ -0,0 +1,237 @@
+import mmap
+
+import numpy as np
+
+from LaserCore import HELIOS_POINT_DTYPE, Frame, as_point_array
+
+
+ILDA_MAGIC = b'ILDA'
+
+ILDA_HEADER_DTYPE = np.dtype([
+    ('magic', 'S4'),
+    ('reserved', 'S3'),
+    ('format', 'u1'),
+    ('name', 'S8'),
+    ('company', 'S8'),
+    ('records', '>u2'),
+    ('number', '>u2'),      # Frame or palette number
+    ('total', '>u2'),       # Total frames in the sequence
+    ('projector', 'u1'),
+    ('reserved2', 'u1')
+])
+
+# Records of each section format. Coordinates are big-endian signed 16 bit.
+ILDA_FORMATS = {
+    0: np.dtype([('x', '>i2'), ('y', '>i2'), ('z', '>i2'), ('status', 'u1'), ('color', 'u1')]),    # 3D indexed
+    1: np.dtype([('x', '>i2'), ('y', '>i2'), ('status', 'u1'), ('color', 'u1')]),                   # 2D indexed
+    2: np.dtype([('r', 'u1'), ('g', 'u1'), ('b', 'u1')]),                                           # Palette
+    4: np.dtype([('x', '>i2'), ('y', '>i2'), ('z', '>i2'), ('status', 'u1'),
+                 ('b', 'u1'), ('g', 'u1'), ('r', 'u1')]),                                           # 3D true color
+    5: np.dtype([('x', '>i2'), ('y', '>i2'), ('status', 'u1'), ('b', 'u1'), ('g', 'u1'), ('r', 'u1')]),  # 2D true color
+}
+PALETTE_FORMAT = 2
+
+STATUS_LAST_POINT = 0x80
+STATUS_BLANKED = 0x40
+
+# Standard ILDA 64 color palette, used by indexed frames until a file supplies its own
+ILDA_DEFAULT_PALETTE = np.array([
+    (255, 0, 0), (255, 16, 0), (255, 32, 0), (255, 48, 0), (255, 64, 0), (255, 80, 0), (255, 96, 0), (255, 112, 0),
+    (255, 128, 0), (255, 144, 0), (255, 160, 0), (255, 176, 0), (255, 192, 0), (255, 208, 0), (255, 224, 0), (255, 240, 0),
+    (255, 255, 0), (224, 255, 0), (192, 255, 0), (160, 255, 0), (128, 255, 0), (96, 255, 0), (64, 255, 0), (32, 255, 0),
+    (0, 255, 0), (0, 255, 36), (0, 255, 73), (0, 255, 109), (0, 255, 146), (0, 255, 182), (0, 255, 219), (0, 255, 255),
+    (0, 227, 255), (0, 198, 255), (0, 170, 255), (0, 142, 255), (0, 113, 255), (0, 85, 255), (0, 56, 255), (0, 28, 255),
+    (0, 0, 255), (32, 0, 255), (64, 0, 255), (96, 0, 255), (128, 0, 255), (160, 0, 255), (192, 0, 255), (224, 0, 255),
+    (255, 0, 255), (255, 32, 255), (255, 64, 255), (255, 96, 255), (255, 128, 255), (255, 160, 255), (255, 192, 255), (255, 224, 255),
+    (255, 255, 255), (255, 224, 224), (255, 192, 192), (255, 160, 160), (255, 128, 128), (255, 96, 96), (255, 64, 64), (255, 32, 32),
+], dtype=np.uint8)
+
+
+def _decode(records, rgb):
+    """ The 16 bit signed coordinates map onto the DAC's 12 bit range, (v + 32768) >> 4,
+        and blanked points get no color. """
+    points = np.zeros(len(records), dtype=HELIOS_POINT_DTYPE)
+    points['x'] = (records['x'].astype(np.int32) + 32768) >> 4
+    points['y'] = (records['y'].astype(np.int32) + 32768) >> 4
+    lit = (records['status'] & STATUS_BLANKED) == 0
+    points['r'] = np.where(lit, rgb[0], 0)
+    points['g'] = np.where(lit, rgb[1], 0)
+    points['b'] = np.where(lit, rgb[2], 0)
+    return points
+
+
+def ilda_to_points(records, format, palette=ILDA_DEFAULT_PALETTE):
+    """ HELIOS_POINT_DTYPE array from ILDA point records of the given format. """
+    if format in (0, 1):
+        return _decode(records, palette[np.minimum(records['color'], len(palette) - 1)].T)
+    return _decode(records, (records['r'], records['g'], records['b']))
+
+
+def _non_empty(points):
+    """ points, or a single blanked point at the center if there are none. """
+    if len(points) > 0:
+        return points
+    points = np.zeros(1, dtype=HELIOS_POINT_DTYPE)
+    points['x'] = points['y'] = 0x800
+    return points
+
+
+def points_to_ilda(points, format=5, palette=ILDA_DEFAULT_PALETTE):
+    """ ILDA point records for a HELIOS_POINT_DTYPE array. Points with no color are blanked and
+        indexed formats use the nearest palette color. Positions are clamped to the DAC's 12 bit
+        range first, which is all the ILDA coordinates map back onto. An empty frame becomes one
+        blanked point, since a section without records marks the end of the file. """
+    points = _non_empty(as_point_array(points))
+    records = np.zeros(len(points), dtype=ILDA_FORMATS[format])
+    # Anything past 0xFFF would wrap around the 16 bit coordinates to the other side
+    records['x'] = (np.minimum(points['x'], 0xFFF).astype(np.int32) << 4) - 32768
+    records['y'] = (np.minimum(points['y'], 0xFFF).astype(np.int32) << 4) - 32768
+    rgb = np.stack([points['r'], points['g'], points['b']], axis=1)
+    blanked = ~rgb.any(axis=1)
+    records['status'] = np.where(blanked, STATUS_BLANKED, 0)
+    records['status'][-1] |= STATUS_LAST_POINT
+    if format in (0, 1):
+        # Match each distinct color once, frames rarely use more than a handful
+        keys, inverse = np.unique(rgb.astype(np.int32) @ np.array([1 << 16, 1 << 8, 1]), return_inverse=True)
+        colors = np.stack([keys >> 16, (keys >> 8) & 0xFF, keys & 0xFF], axis=1)
+        distance = ((colors[:, None, :] - palette[None, :, :].astype(np.int32))**2).sum(axis=2)
+        records['color'] = np.argmin(distance, axis=1)[inverse.reshape(-1)]
+    else:
+        records['r'], records['g'], records['b'] = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+    return records
+
+
+class IldaReader:
+    """ Reads the frames of an ILDA file lazily from a memory map.
+
+        Opening the file only walks the 32 byte section headers. Frames are decoded when they are
+        asked for, either one at a time by index or iteration, or all at once with read_all().
+        Palette sections (format 2) apply to the indexed frames that follow them.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.palettes = [ILDA_DEFAULT_PALETTE]
+        # Per frame: format, offset of its first record, number of records, palette, name
+        formats, offsets, counts, palette_ids, names = [], [], [], [], []
+        offset = 0
+        while offset + ILDA_HEADER_DTYPE.itemsize <= len(self._map):
+            header = np.frombuffer(self._map, ILDA_HEADER_DTYPE, 1, offset)[0]
+            if header['magic'] != ILDA_MAGIC:
+                raise ValueError(f'Bad ILDA section header at byte {offset} of {path}')
+            format, records = int(header['format']), int(header['records'])
+            if format not in ILDA_FORMATS:
+                raise ValueError(f'Unsupported ILDA format {format} at byte {offset} of {path}')
+            if records == 0:
+                break
+            offset += ILDA_HEADER_DTYPE.itemsize
+            if format == PALETTE_FORMAT:
+                palette = np.frombuffer(self._map, ILDA_FORMATS[format], records, offset)
+                self.palettes.append(np.stack([palette['r'], palette['g'], palette['b']], axis=1))
+            else:
+                formats.append(format)
+                offsets.append(offset)
+                counts.append(records)
+                palette_ids.append(len(self.palettes) - 1)
+                names.append(header['name'].decode('ascii', 'replace'))
+            offset += records * ILDA_FORMATS[format].itemsize
+        self.formats = np.array(formats, dtype=np.int64)
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.counts = np.array(counts, dtype=np.int64)
+        self.palette_ids = np.array(palette_ids, dtype=np.int64)
+        self.names = names
+
+    def __len__(self):
+        return len(self.counts)
+
+    def records(self, k):
+        """ Raw ILDA records of frame k, as a view into the file. """
+        return np.frombuffer(self._map, ILDA_FORMATS[self.formats[k]], self.counts[k], self.offsets[k])
+
+    def __getitem__(self, k):
+        return ilda_to_points(self.records(k), self.formats[k], self.palettes[self.palette_ids[k]])
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self[k]
+
+    def read_all(self):
+        """ Every frame, decoded in one vectorized pass per section format. Returns a list of arrays
+            that are views into one contiguous HELIOS_POINT_DTYPE array. """
+        if len(self) == 0:
+            return []
+        points = np.zeros(int(self.counts.sum()), dtype=HELIOS_POINT_DTYPE)
+        first = np.cumsum(self.counts) - self.counts
+        palette_starts = np.cumsum([0] + [len(p) for p in self.palettes])
+        all_palettes = np.concatenate(self.palettes)
+        for format in np.unique(self.formats):
+            frames = np.flatnonzero(self.formats == format)
+            counts = self.counts[frames]
+            dtype = ILDA_FORMATS[format]
+            # Each section is already an array of records in the file; join them with one copy
+            records = np.concatenate([np.frombuffer(self._map, dtype, int(count), int(offset))
+                                      for count, offset in zip(counts, self.offsets[frames])])
+            frame_of = np.repeat(np.arange(len(frames)), counts)
+            slots = first[frames][frame_of] + np.arange(len(frame_of)) - (np.cumsum(counts) - counts)[frame_of]
+            if format in (0, 1):
+                # Look each color index up in its own frame's palette
+                palette_ids = self.palette_ids[frames][frame_of]
+                sizes = np.diff(palette_starts)[palette_ids]
+                color = palette_starts[palette_ids] + np.minimum(records['color'], sizes - 1)
+                points[slots] = _decode(records, all_palettes[color].T)
+            else:
+                points[slots] = _decode(records, (records['r'], records['g'], records['b']))
+        return np.split(points, first[1:])
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_ilda(path):
+    """ All frames of an ILDA file as a list of HELIOS_POINT_DTYPE arrays. """
+    with IldaReader(path) as reader:
+        return reader.read_all()
+
+
+def _header(format, records, number, total, name, company):
+    header = np.zeros(1, dtype=ILDA_HEADER_DTYPE)
+    header[0] = (ILDA_MAGIC, b'', format, name.encode('ascii')[:8], company.encode('ascii')[:8], records, number, total, 0, 0)
+    return header.tobytes()
+
+
+def write_ilda(path, frames, format=5, palette=None, name='', company='Helios'):
+    """ Write frames (Frames or HELIOS_POINT_DTYPE arrays) to an ILDA file.
+        Indexed formats 0 and 1 use palette, written to the file as a format 2 section when given,
+        or the standard ILDA palette otherwise. """
+    if format not in ILDA_FORMATS or format == PALETTE_FORMAT:
+        raise ValueError(f'Cannot write frames in ILDA format {format}')
+    frames = [_non_empty(as_point_array(f.points)[:f.count] if isinstance(f, Frame) else as_point_array(f)) for f in frames]
+    if len(frames) > 0xFFFF:
+        raise ValueError('ILDA files hold at most 65535 frames')
+    if any(len(points) > 0xFFFF for points in frames):
+        raise ValueError('ILDA frames hold at most 65535 points')
+    with open(path, 'wb') as f:
+        if format in (0, 1) and palette is not None:
+            palette = np.asarray(palette, dtype=np.uint8).reshape(-1, 3)
+            f.write(_header(PALETTE_FORMAT, len(palette), 0, 0, name, company))
+            f.write(palette.tobytes())
+        elif palette is None:
+            palette = ILDA_DEFAULT_PALETTE
+        # Convert every frame in one pass, then mark where each one ends
+        counts = np.array([len(points) for points in frames], dtype=np.int64)
+        ends = np.cumsum(counts)
+        records = points_to_ilda(np.concatenate(frames), format, palette) if frames else None
+        if frames:
+            records['status'][ends - 1] |= STATUS_LAST_POINT
+        for number, (start, end) in enumerate(zip(ends - counts, ends)):
+            f.write(_header(format, end - start, number, len(frames), name, company))
+            f.write(records[start:end].tobytes())
+        f.write(_header(format, 0, len(frames), len(frames), name, company))
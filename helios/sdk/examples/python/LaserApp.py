@@ -5,6 +5,9 @@ from PyQt5.QtCore import QTimer
 import numpy as np 
 
 from LaserCore import LaserCore
+from PointBudget import PointBudget
+from DwellPlanner import DwellPlanner
+from TravelPlanner import TravelPlanner
 from FFTEffect import FFT
 from VectorRenderEffect import Camera, ShapeRendererEffect, Cube, Pyramid, Tetrahedron, Octahedron, Sphere, Torus, Star, Prism, Cylinder
 
@@ -21,7 +24,7 @@ class LaserShowApp(QWidget):
         self.initUI()
         
         # Initialize laser and effects
-        self.laser = LaserCore(".\\HeliosLaserDAC.dll", frame_size=4000)
+        self.laser = LaserCore(".\\HeliosLaserDAC.dll", frame_size=4000, async_output=True, frame_barrier=True, skip_unchanged=True)
         self.camera = Camera(position=(0, -800, -10), rotation=(0.0, 0.0, 0.0))
         self.angle_increment = 20*np.pi / 180  
         
@@ -83,6 +86,20 @@ class LaserShowApp(QWidget):
         
 
 
+        # Keep every frame within the DAC's point limit instead of letting it truncate
+        self.point_budget = PointBudget(pps=40000)
+        # Pace blanked jumps for this projector's galvos
+        self.travel_planner = TravelPlanner(pps=40000)
+        for effect in (self.fft_effect1, self.fft_effect2, self.fft_effect3, self.fft_effect4, self.fft_effect5,
+                       self.shape_effect1, self.shape_effect2, self.shape_effect3, self.shape_effect4, self.shape_effect5):
+            effect.point_budget = self.point_budget
+            effect.travel_planner = self.travel_planner
+
+        # Hold the beam on corners by how sharp they are, rather than the same count on every vertex
+        self.dwell_planner = DwellPlanner()
+        for effect in (self.shape_effect1, self.shape_effect2, self.shape_effect3, self.shape_effect4, self.shape_effect5):
+            effect.dwell_planner = self.dwell_planner
+
         self.current_effect = self.fft_effect1
 
         # Set up a timer to update the laser frames
@@ -187,22 +204,27 @@ class LaserShowApp(QWidget):
 
     def update_frame(self):
         try:
-            for device_index in range(self.laser.num_devices):
-                self.camera.position[2] = -2000 + np.sin(self.loop_cnt/10) * 1000
-                self.loop_cnt += 1
-                self.shape_effect1.shape.rotate(0, self.angle_increment, 0)
-                self.shape_effect2.shape.rotate(self.angle_increment, 0, 0)
-                self.shape_effect3.shape.rotate(0, 0, self.angle_increment)
-                self.shape_effect4.shape.rotate(0, self.angle_increment, self.angle_increment)
-                self.shape_effect5.shape.rotate(0, self.angle_increment, 0)
-                # self.shape_effect6.shape.rotate(self.angle_increment, self.angle_increment, self.angle_increment)
-                # self.shape_effect7.shape.rotate(self.angle_increment, self.angle_increment, self.angle_increment)
-                # self.shape_effect8.shape.rotate(0, self.angle_increment, 0)
-                # self.shape_effect9.shape.rotate(0, -self.angle_increment, 0)
-
-                
-                self.current_effect.update_frame(self.laser.frame, clear=True, camera=self.camera)
-                self.laser.write_frame(0, 40000, self.laser.frame.points, self.laser.frame.count)
+            self.camera.position[2] = -2000 + np.sin(self.loop_cnt/10) * 1000
+            self.loop_cnt += 1
+            self.shape_effect1.shape.rotate(0, self.angle_increment, 0)
+            self.shape_effect2.shape.rotate(self.angle_increment, 0, 0)
+            self.shape_effect3.shape.rotate(0, 0, self.angle_increment)
+            self.shape_effect4.shape.rotate(0, self.angle_increment, self.angle_increment)
+            self.shape_effect5.shape.rotate(0, self.angle_increment, 0)
+            # self.shape_effect6.shape.rotate(self.angle_increment, self.angle_increment, self.angle_increment)
+            # self.shape_effect7.shape.rotate(self.angle_increment, self.angle_increment, self.angle_increment)
+            # self.shape_effect8.shape.rotate(0, self.angle_increment, 0)
+            # self.shape_effect9.shape.rotate(0, -self.angle_increment, 0)
+
+            # Render once into a pooled frame and send it to every DAC in parallel
+            frame = self.laser.acquire_frame()
+            try:
+                self.current_effect.update_frame(frame, clear=True, camera=self.camera)
+            except Exception:
+                # Not handed to submit_all yet, so it would never get back to the pool
+                self.laser.release_frame(frame)
+                raise
+            self.laser.submit_all(40000, frame)
         except Exception as e:
             print(f"Error updating frame: {e}")
 
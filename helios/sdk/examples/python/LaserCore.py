@@ -7,9 +7,25 @@ Created on Thu May  9 20:57:18 2024
 
 
 import ctypes
+import functools
 import random
 import math
+import queue
+import threading
 import time
+import zlib
+
+import numpy as np
+
+# Limits from HeliosDac.h
+HELIOS_MAX_POINTS = 0x1000
+HELIOS_MAX_RATE = 0xFFFF
+HELIOS_MIN_RATE = 7
+
+HELIOS_FLAGS_DEFAULT = 0
+HELIOS_FLAGS_START_IMMEDIATELY = 1 << 0
+HELIOS_FLAGS_SINGLE_MODE = 1 << 1
+HELIOS_FLAGS_DONT_BLOCK = 1 << 2
 
 #%%
 class HeliosPoint(ctypes.Structure):
@@ -22,6 +38,144 @@ class HeliosPoint(ctypes.Structure):
         ('i', ctypes.c_uint8)  # Intensity
     ]
 
+# Same memory layout as HeliosPoint, so arrays of either can share one buffer
+HELIOS_POINT_DTYPE = np.dtype([
+    ('x', np.uint16),
+    ('y', np.uint16),
+    ('r', np.uint8),
+    ('g', np.uint8),
+    ('b', np.uint8),
+    ('i', np.uint8)  # Intensity
+])
+
+
+def as_point_array(points):
+    """ Structured ndarray view of a HeliosPoint ctypes array or a HELIOS_POINT_DTYPE array, without copying. """
+    if isinstance(points, np.ndarray):
+        if points.dtype != HELIOS_POINT_DTYPE or not points.flags.c_contiguous:
+            raise ValueError('Point arrays must be contiguous and use HELIOS_POINT_DTYPE')
+        return points
+    return np.frombuffer(points, dtype=HELIOS_POINT_DTYPE)
+
+
+def _as_colors(colors, count):
+    """ Broadcast a single (r,g,b,i) tuple or an (N,4) array of colors to count rows of uint8. """
+    colors = np.asarray(colors, dtype=np.uint8)
+    return np.broadcast_to(colors.reshape(-1, 4), (count, 4))
+
+
+def _smooth_profile_walk(length, min_step_size, max_step_size, transition_length, max_iterations):
+    """ Reference walk along the segment, one step at a time. Used for parameters the closed form doesn't cover. """
+    positions = []
+    p = 0.0
+    while len(positions) < max_iterations:
+        dist_to_end = length - p
+        if dist_to_end < min_step_size:
+            break
+        dist_to_closest_endpoint = min(p, dist_to_end)
+        if dist_to_closest_endpoint < transition_length:
+            step_size = min_step_size + (max_step_size - min_step_size) * (dist_to_closest_endpoint / transition_length)
+        else:
+            step_size = max_step_size
+        p = min(p + step_size, length)
+        positions.append(p)
+    return np.array(positions)
+
+
+def _leading_run(mask):
+    """ Number of leading True values in mask. """
+    return len(mask) if mask.all() else int(np.argmin(mask))
+
+
+@functools.lru_cache(maxsize=4096)
+def smooth_line_profile(length, min_step_size=1, max_step_size=50, transition_length=100, max_iterations=1000):
+    """ Positions add_line_smooth steps through, as fractions of a segment of the given length (end point excluded).
+
+        The step size grows linearly with the distance d to the nearest endpoint, step = a + b*d,
+        so each phase of the walk has a closed form:
+          ramp up    p_k = c*((1+b)^k - 1)           with c = a/b
+          cruise     p_j = p + j*max_step_size
+          ramp down  q_k = (q_0 + c)*(1-b)^k - c     with q = length - p
+        The returned array is read-only, since it is shared through the cache. """
+    L = float(length)
+    a, M, T = min_step_size, max_step_size, transition_length
+    if L <= 0:
+        positions = np.empty(0)
+    elif a <= 0 or M < a or 0 < T < a:
+        positions = _smooth_profile_walk(L, a, M, T, max_iterations)
+    else:
+        b = (M - a) / T if T > 0 else 0.0
+        c = a / b if b > 0 else 0.0
+        parts = []
+        p = 0.0
+        steps_left = max_iterations
+
+        # Ramp up from the start point: valid while p < T, p <= L/2 and the end is at least a away
+        if T > 0 and L >= a:
+            limit = min(T, L / 2, L - a)
+            if b > 0:
+                estimate = math.log(limit / c + 1) / math.log1p(b)
+                k = np.arange(min(int(estimate) + 3, steps_left + 1))
+                pos = c * np.expm1(k * math.log1p(b))
+            else:
+                k = np.arange(min(int(limit / a) + 3, steps_left + 1))
+                pos = k * a
+            num = min(_leading_run((pos < T) & (pos <= L / 2) & (L - pos >= a)), steps_left, len(pos) - 1)
+            if num > 0:
+                parts.append(np.minimum(pos[1:num + 1], L))
+                p = min(pos[num], L)
+                steps_left -= num
+
+        # Cruise at max_step_size while both endpoints are at least T away
+        if steps_left > 0 and p >= T and L - p >= max(T, a):
+            num = min(int((L - max(T, a) - p) // M) + 1, steps_left)
+            pos = np.minimum(p + M * np.arange(1, num + 1), L)
+            parts.append(pos)
+            p = pos[-1]
+            steps_left -= num
+
+        # Ramp down towards the end point until it is closer than a
+        q0 = L - p
+        if steps_left > 0 and q0 >= a:
+            if b >= 1:
+                q = np.array([q0, (1 - b) * q0 - a])
+            elif b > 0:
+                estimate = math.log((a + c) / (q0 + c)) / math.log1p(-b)
+                k = np.arange(min(int(estimate) + 3, steps_left + 1))
+                q = (q0 + c) * np.exp(k * math.log1p(-b)) - c
+            else:
+                k = np.arange(min(int(q0 // a) + 3, steps_left + 1))
+                q = q0 - k * a
+            num = min(_leading_run(q >= a), steps_left, len(q) - 1)
+            parts.append(L - np.maximum(q[1:num + 1], 0))
+
+        positions = np.concatenate(parts) if parts else np.empty(0)
+
+    fractions = positions / L if L > 0 else positions
+    fractions.flags.writeable = False
+    return fractions
+
+
+def interpolate_lines(starts, ends, step_size=10):
+    """ Interpolate every segment the way Frame.add_line does, in one pass.
+        Returns x and y arrays plus the index of the segment each point belongs to. """
+    starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+    delta = ends - starts
+    distance = np.sqrt(delta[:, 0]**2 + delta[:, 1]**2)
+    num_steps = np.where(distance > step_size, np.floor(distance / step_size), 0).astype(np.int64)
+
+    # Step number k (1..num_steps) of every output point, grouped by segment
+    segment = np.repeat(np.arange(len(starts)), num_steps)
+    first = np.cumsum(num_steps) - num_steps
+    step = np.arange(len(segment)) - first[segment] + 1
+    fraction = step / num_steps[segment]
+
+    xs = np.rint(starts[segment, 0] + fraction * delta[segment, 0]).astype(np.int64)
+    ys = np.rint(starts[segment, 1] + fraction * delta[segment, 1]).astype(np.int64)
+    return xs, ys, segment
+
+
 class Frame:
     def __init__(self, size=1000):
         self.points = (HeliosPoint * size)()  # Allocate space for points
@@ -51,82 +205,469 @@ class Frame:
                 
                 intermediate_point = HeliosPoint(intermediate_x, intermediate_y, color[0], color[1], color[2], color[3])
                 self.add_point(intermediate_point)
-                
+
+    def add_lines(self, starts, ends, colors=(0,0,0,0), step_size=10):
+        """ Batched add_line: starts/ends are (N,2) arrays, colors one tuple or one per segment.
+            Produces the same points as calling add_line on each segment in order. """
+        xs, ys, segment = interpolate_lines(starts, ends, step_size)
+        colors = np.asarray(colors, dtype=np.uint8).reshape(-1, 4)
+        if len(colors) > 1:
+            colors = colors[segment]
+        self.extend(xs, ys, colors)
+
 
     def add_line_smooth(self, start_point, end_point, color=(0,0,0,0), min_step_size=1, max_step_size=50, transition_length=100, max_iterations=1000):
-        """ Incrementally moves from start_point to end_point by step_size until close enough or max_iterations reached. """
-        current_x, current_y = start_point.x, start_point.y
+        """ Moves from start_point to end_point with steps that ease in and out over transition_length.
+            The step positions come from a cached profile for the (rounded) segment length. """
         dx, dy = end_point.x - start_point.x, end_point.y - start_point.y
         total_distance = math.sqrt(dx**2 + dy**2)
-        iteration = 0
-    
-        while iteration < max_iterations:
-                dist_to_end = math.sqrt((end_point.x - current_x)**2 + (end_point.y - current_y)**2)
-                
-                if dist_to_end < min_step_size:
-                    break  # Close enough to target point
-                
-                # Calculate distance from the closest endpoint
-                dist_from_start = math.sqrt((current_x - start_point.x)**2 + (current_y - start_point.y)**2)
-                dist_to_closest_endpoint = min(dist_from_start, dist_to_end)
-        
-                # Determine step size based on the distance from the closest endpoint
-                if dist_to_closest_endpoint < transition_length:
-                    # Linear interpolation between min_step_size and max_step_size
-                    step_size = min_step_size + (max_step_size - min_step_size) * (dist_to_closest_endpoint / transition_length)
-                else:
-                    step_size = max_step_size
-                
-                # print(step_size)
-                # Update step direction
-                step_x = dx / total_distance * step_size
-                step_y = dy / total_distance * step_size
-                
-                # Move the point
-                current_x += step_x
-                current_y += step_y
-        
-                # Clip current_x and current_y to not exceed end_point
-                if (step_x > 0 and current_x > end_point.x) or (step_x < 0 and current_x < end_point.x):
-                    current_x = end_point.x
-                if (step_y > 0 and current_y > end_point.y) or (step_y < 0 and current_y < end_point.y):
-                    current_y = end_point.y
-        
-                intermediate_point = HeliosPoint(round(current_x), round(current_y), color[0], color[1], color[2], color[3])
-                self.add_point(intermediate_point)
-        
-                iteration += 1
-    
+        fractions = smooth_line_profile(round(total_distance), min_step_size, max_step_size, transition_length, max_iterations)
+
+        xs = np.rint(start_point.x + fractions * dx).astype(np.int64)
+        ys = np.rint(start_point.y + fractions * dy).astype(np.int64)
         # Add the final point to ensure the line reaches the end_point
-        final_point = HeliosPoint(end_point.x, end_point.y, color[0], color[1], color[2], color[3])
-        self.add_point(final_point)
+        self.extend(np.append(xs, end_point.x), np.append(ys, end_point.y), color)
                 
-    def move_head_to_point(self, point, min_step_size=10, max_step_size=50, transition_length=100):
-        if(self.count > 0):
+    def move_head_to_point(self, point, min_step_size=10, max_step_size=50, transition_length=100, travel_planner=None):
+        """ Blanked move from the last point to point. A TravelPlanner paces it like the galvos
+            and adds the blank holds around the jump; otherwise it steps at min_step_size. """
+        if self.count > 0 and travel_planner is not None:
+            last = self.points[self.count-1]
+            xs, ys, _ = travel_planner.plan((last.x, last.y), (point.x, point.y))
+            self.extend(xs, ys, (0,0,0,0))
+        elif(self.count > 0):
             self.add_line(self.points[self.count-1], point, (0,0,0,0), min_step_size)
             # self.add_line_smooth(self.points[self.count-1], point, (0,0,0,0), min_step_size=min_step_size, max_step_size=max_step_size, transition_length=transition_length)
         
             
             
+    def extend(self, xs, ys, colors=(0,0,0,0)):
+        """ Append many points at once. colors is one (r,g,b,i) tuple or one per point.
+            Points that don't fit in the frame are dropped, like add_point does. """
+        n = min(len(xs), self.size - self.count)
+        if n <= 0:
+            return
+        colors = _as_colors(colors, len(xs))
+        # Written straight into the HeliosPoint buffer through a structured view
+        out = as_point_array(self.points)[self.count:self.count + n]
+        out['x'] = np.asarray(xs[:n])
+        out['y'] = np.asarray(ys[:n])
+        out['r'] = colors[:n, 0]
+        out['g'] = colors[:n, 1]
+        out['b'] = colors[:n, 2]
+        out['i'] = colors[:n, 3]
+        self.count += n
+
+    def add_points(self, points):
+        """ Append a HELIOS_POINT_DTYPE array or HeliosPoint array as is. """
+        n = min(len(points), self.size - self.count)
+        if n > 0:
+            as_point_array(self.points)[self.count:self.count + n] = as_point_array(points)[:n]
+            self.count += n
+
     def clear(self):
         self.count = 0
 
+
+class NumpyFrame(Frame):
+    """ Frame stored in a HELIOS_POINT_DTYPE array. self.points aliases the same memory as a
+        HeliosPoint array, so existing effects and write_frame work on it unchanged. """
+    def __init__(self, size=1000):
+        self.array = np.zeros(size, dtype=HELIOS_POINT_DTYPE)
+        self.points = (HeliosPoint * size).from_buffer(self.array)
+        self.size = size
+        self.count = 0
+
+    def add_point(self, point):
+        if self.count < self.size:
+            self.array[self.count] = (point.x, point.y, point.r, point.g, point.b, point.i)
+            self.count += 1
+
+    def __getitem__(self, index):
+        return self.array[:self.count][index]
+
+    def __setitem__(self, index, value):
+        # Slice writes go straight into the buffer; they only touch points already in the frame
+        self.array[:self.count][index] = value
+
+    def __len__(self):
+        return self.count
+
     
             
+def wait_until_ready(lib, device_index, poll_interval=0.0, max_poll_interval=0.001):
+    """ Poll GetStatus until the DAC can take a frame, backing off from poll_interval to max_poll_interval. """
+    delay = poll_interval
+    while lib.GetStatus(device_index) != 1:
+        time.sleep(delay)
+        delay = min(max(delay * 2, 0.0001), max_poll_interval)
+
+
+class OutputStage:
+    """ Per-device processing applied to a finished frame just before WriteFrame.
+
+        The frame is copied once into a buffer owned by the stage and corrected there, so a frame
+        shared by several devices is never changed. warp is a WarpGrid, calibration a
+        ColorCalibration and zones a ZoneMask; any of them can be None. Positions are warped first,
+        then colors corrected, and the zones are blanked last so nothing can light them up again.
+    """
+    def __init__(self, calibration=None, warp=None, zones=None):
+        self.calibration = calibration
+        self.warp = warp
+        self.zones = zones
+        self.buffer = np.zeros(HELIOS_MAX_POINTS, dtype=HELIOS_POINT_DTYPE)
+
+    def process(self, points, point_count):
+        """ Corrected copy of the first point_count points. It is only valid until the next call. """
+        points = as_point_array(points)[:point_count]
+        if len(points) > len(self.buffer):
+            self.buffer = np.zeros(len(points), dtype=HELIOS_POINT_DTYPE)
+        out = self.buffer[:len(points)]
+        out[...] = points
+        if self.warp is not None:
+            self.warp.apply(out)
+        if self.calibration is not None:
+            self.calibration.apply(out)
+        if self.zones is not None:
+            out = self.zones.apply(out, HELIOS_MAX_POINTS)
+        return out
+
+
+class DacWriter(threading.Thread):
+    """ Sends frames to one DAC from a bounded queue on its own thread.
+
+        submit() copies the points and returns straight away, so the next frame can be built
+        while this one waits for the DAC and goes over USB. It only blocks when the queue is full.
+
+        Writers sharing a threading.Barrier meet at it once their DAC is ready, so every device
+        starts frame k together. Each of them must then be sent the same number of frames.
+        hold() takes the place of a frame that is not sent because the DAC is already looping it.
+    """
+    _STOP = object()
+
+    def __init__(self, lib, device_index, queue_size=2, flags=HELIOS_FLAGS_DEFAULT, max_poll_interval=0.001, barrier=None, barrier_timeout=1.0, output_stage=None):
+        super().__init__(name=f'DacWriter-{device_index}', daemon=True)
+        self.lib = lib
+        self.device_index = device_index
+        self.flags = flags
+        self.max_poll_interval = max_poll_interval
+        self.barrier = barrier
+        self.barrier_timeout = barrier_timeout
+        self.output_stage = output_stage
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.frames_written = 0
+        self.last_result = None     # Return code of the last WriteFrame, negative on error
+        self.start()
+
+    def submit(self, frame_rate, points, point_count, block=True, timeout=None, copy=True, on_done=None):
+        """ Queue the first point_count points. Raises queue.Full if block is False and the queue is full.
+            With copy=False the caller must leave the points alone until on_done is called after the write. """
+        array = as_point_array(points)[:point_count]
+        if copy:
+            array = np.array(array)
+        self.queue.put((frame_rate, array, point_count, on_done), block, timeout)
+
+    def hold(self, frame_rate, point_count, block=True, timeout=None):
+        """ Queue a pause as long as the DAC takes to loop its current frame of point_count points once,
+            so a skipped write still paces the submissions behind it like a write would. """
+        self.queue.put((frame_rate, None, point_count, None), block, timeout)
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is self._STOP:
+                break
+            frame_rate, array, point_count, on_done = item
+            if array is None:
+                # Nothing to send, the DAC keeps looping what it has; holds skip the barrier too
+                time.sleep(point_count / frame_rate)
+                continue
+            # Correct the frame while the DAC is still busy with the previous one
+            stage = self.output_stage
+            if stage is not None:
+                array = stage.process(array, point_count)
+                point_count = len(array)
+            wait_until_ready(self.lib, self.device_index, max_poll_interval=self.max_poll_interval)
+            if self.barrier is not None:
+                try:
+                    self.barrier.wait(self.barrier_timeout)
+                except threading.BrokenBarrierError:
+                    # A device fell behind or was not sent this frame; write anyway and resync on the next one
+                    self.barrier.reset()
+            points = array.ctypes.data_as(ctypes.POINTER(HeliosPoint))
+            self.last_result = self.lib.WriteFrame(self.device_index, frame_rate, self.flags, points, point_count)
+            self.frames_written += 1
+            if on_done is not None:
+                on_done()
+
+    def stop(self):
+        """ Send whatever is still queued, then end the thread. """
+        self.queue.put(self._STOP)
+        self.join()
+
+
+class FramePool:
+    """ Preallocated ring of NumpyFrames handed out with acquire() and given back with release().
+
+        A frame is owned by whoever acquired it until it is released, which for submitted frames
+        happens once the DAC writer has sent it. acquire() blocks while every frame is in use.
+        Releasing a frame that is already free, or that isn't from this pool, raises ValueError,
+        since it would otherwise be handed to two renders at once.
+    """
+    def __init__(self, count=3, frame_size=1000):
+        self.frames = [NumpyFrame(frame_size) for _ in range(count)]
+        self._free = queue.Queue()
+        self._free_ids = {id(frame) for frame in self.frames}
+        self._lock = threading.Lock()
+        for frame in self.frames:
+            self._free.put(frame)
+
+    def acquire(self, block=True, timeout=None):
+        """ Next free frame, cleared. Raises queue.Empty if none frees up in time. """
+        frame = self._free.get(block, timeout)
+        with self._lock:
+            self._free_ids.discard(id(frame))
+        frame.clear()
+        return frame
+
+    def release(self, frame):
+        with self._lock:
+            if not any(frame is own for own in self.frames):
+                raise ValueError('Frame is not from this pool')
+            if id(frame) in self._free_ids:
+                raise ValueError('Frame was released twice')
+            self._free_ids.add(id(frame))
+        self._free.put(frame)
+
+    def available(self):
+        return self._free.qsize()
+
+
 class LaserCore:
-    def __init__(self, dll_path, frame_size=1000):
-        self.lib = ctypes.cdll.LoadLibrary(dll_path)
+    def __init__(self, dll_path, frame_size=1000, use_numpy=False, async_output=False, queue_size=2, pool_size=3, frame_barrier=False, lib=None, skip_unchanged=False):
+        # lib replaces the DLL with any object offering the same calls, e.g. HeliosSim for running without hardware
+        self.lib = ctypes.cdll.LoadLibrary(dll_path) if lib is None else lib
         self.num_devices = self.lib.OpenDevices()
-        self.frame = Frame(frame_size)
+        self.frame = NumpyFrame(frame_size) if use_numpy else Frame(frame_size)
+        # With async_output, write_frame hands frames to a DacWriter thread per device
+        self.async_output = async_output
+        self.queue_size = queue_size
+        self.writers = {}
+        # Frames for acquire_frame/submit_frame, rendered while earlier ones are still being sent.
+        # The pool is only allocated once acquire_frame is first used
+        self.frame_size = frame_size
+        self.pool_size = pool_size
+        self._pool = None
+        # Optional FrameRecorder that gets every frame sent to a device
+        self.recorder = None
+        # device_index -> OutputStage applied just before WriteFrame
+        self.output_stages = {}
+        # With skip_unchanged, a frame identical to the one a DAC is already queued with or
+        # looping is not sent again. Frames are compared by rate, size and a CRC of the points.
+        # With async_output the device's writer waits in its place, so the pace stays the same;
+        # otherwise the call returns at once and the caller's own timer sets the pace.
+        self.skip_unchanged = skip_unchanged
+        self._sent = {}            # device_index -> key of the last frame sent to it
+        self.frames_sent = 0
+        self.frames_skipped = 0    # Transfers saved by skip_unchanged
+        self.bytes_saved = 0
         print("Found", self.num_devices, "Helios DACs")
+
+        # With frame_barrier, the writers of all devices start each frame together
+        self.barrier = None
+        if async_output and frame_barrier and self.num_devices > 1:
+            self.barrier = threading.Barrier(self.num_devices)
+            for device_index in range(self.num_devices):
+                self.writer(device_index)
+
+    def writer(self, device_index):
+        """ The DacWriter for a device, started on first use. """
+        if device_index not in self.writers:
+            self.writers[device_index] = DacWriter(self.lib, device_index, self.queue_size, barrier=self.barrier,
+                                                   output_stage=self.output_stages.get(device_index))
+        return self.writers[device_index]
+
+    def set_output_stage(self, device_index, stage):
+        """ Use an OutputStage (or None) for every frame sent to a device from now on. """
+        self.output_stages[device_index] = stage
+        self.resend(device_index)
+        if device_index in self.writers:
+            self.writers[device_index].output_stage = stage
+
+    def _output_stage(self, device_index):
+        if self.output_stages.get(device_index) is None:
+            self.set_output_stage(device_index, OutputStage())
+        return self.output_stages[device_index]
+
+    def set_calibration(self, device_index, calibration):
+        """ Color-correct every frame sent to a device with a ColorCalibration. """
+        self._output_stage(device_index).calibration = calibration
+        self.resend(device_index)
+
+    def set_warp(self, device_index, warp):
+        """ Warp the geometry of every frame sent to a device with a WarpGrid. """
+        self._output_stage(device_index).warp = warp
+        self.resend(device_index)
+
+    def set_zones(self, device_index, zones):
+        """ Blank every frame sent to a device inside the polygons of a ZoneMask, given in output coordinates. """
+        self._output_stage(device_index).zones = zones
+        self.resend(device_index)
     
+    def resend(self, device_index):
+        """ Send the next frame to a device even if it is unchanged, e.g. after editing its OutputStage directly. """
+        self._sent.pop(device_index, None)
+
+    def _frame_key(self, frame_rate, points, point_count):
+        if not self.skip_unchanged:
+            return None
+        return (frame_rate, point_count, zlib.crc32(as_point_array(points)[:point_count]))
+
+    def _is_playing(self, device_index, key):
+        """ Whether the frame with this key is the last one sent to the device, so it is still queued
+            there or being looped by the DAC. """
+        if key is None or self._sent.get(device_index) != key:
+            return False
+        writer = self.writers.get(device_index)
+        # Frames written in single mode are not looped, and after a failed write something else is playing
+        return writer is None or (not writer.flags & HELIOS_FLAGS_SINGLE_MODE and (writer.last_result is None or writer.last_result >= 0))
+
+    def _count(self, device_index, key, skipped, point_count):
+        if skipped:
+            self.frames_skipped += 1
+            self.bytes_saved += point_count * HELIOS_POINT_DTYPE.itemsize
+        else:
+            self._sent[device_index] = key
+            self.frames_sent += 1
+
+    @property
+    def pool(self):
+        """ The FramePool behind acquire_frame, created on first use. """
+        if self._pool is None:
+            self._pool = FramePool(self.pool_size, self.frame_size)
+        return self._pool
+
+    def acquire_frame(self, block=True, timeout=None):
+        """ A cleared frame from the pool to render into. Hand it to submit_frame, or back to release_frame. """
+        return self.pool.acquire(block, timeout)
+
+    def submit_frame(self, device_index, frame_rate, frame):
+        """ Send a pooled frame without copying it. It goes back to the pool once it has been written. """
+        if self.async_output:
+            self._record(device_index, frame_rate, frame.array, frame.count)
+            key = self._frame_key(frame_rate, frame.array, frame.count)
+            # Writers meeting at the barrier must all get every frame
+            skipped = self.barrier is None and self._is_playing(device_index, key)
+            self._count(device_index, key, skipped, frame.count)
+            if skipped:
+                self.pool.release(frame)
+                self.writer(device_index).hold(frame_rate, frame.count)
+                return
+            self.writer(device_index).submit(frame_rate, frame.array, frame.count, copy=False,
+                                             on_done=lambda: self.pool.release(frame))
+        else:
+            try:
+                self.write_frame(device_index, frame_rate, frame.array, frame.count)
+            finally:
+                self.pool.release(frame)
+
+    def submit_all(self, frame_rate, frames):
+        """ Send pooled frames to every device in parallel, one writer per device.
+            frames is a list with one frame per device, or a single frame that all devices share.
+            Each frame goes back to the pool once every device using it has written it, or right
+            away when they are rejected. """
+        if not isinstance(frames, (list, tuple)):
+            if self.num_devices == 0:
+                self.pool.release(frames)
+                return
+            frames = [frames] * self.num_devices
+        if len(frames) != self.num_devices:
+            for frame in {id(frame): frame for frame in frames}.values():
+                self.pool.release(frame)
+            raise ValueError(f'Expected {self.num_devices} frames, got {len(frames)}')
+
+        if not self.async_output:
+            # Written one device after another; the frames are free again once all are done, or one fails
+            try:
+                for device_index, frame in enumerate(frames):
+                    self.write_frame(device_index, frame_rate, frame.array, frame.count)
+            finally:
+                for frame in {id(frame): frame for frame in frames}.values():
+                    self.pool.release(frame)
+            return
+
+        keys = [self._frame_key(frame_rate, frame.array, frame.count) for frame in frames]
+        skipped = [self._is_playing(device_index, key) for device_index, key in enumerate(keys)]
+        # Writers meeting at the barrier must all get a frame or none
+        if self.barrier is not None and not all(skipped):
+            skipped = [False] * len(frames)
+        for device_index, frame in enumerate(frames):
+            self._count(device_index, keys[device_index], skipped[device_index], frame.count)
+
+        users = {id(frame): 0 for frame in frames}
+        for frame, skip in zip(frames, skipped):
+            users[id(frame)] += not skip
+        lock = threading.Lock()
+
+        def done(frame):
+            with lock:
+                users[id(frame)] -= 1
+                last = users[id(frame)] == 0
+            if last:
+                self.pool.release(frame)
+
+        for frame in {id(frame): frame for frame in frames}.values():
+            if users[id(frame)] == 0:
+                self.pool.release(frame)
+        for device_index, frame in enumerate(frames):
+            self._record(device_index, frame_rate, frame.array, frame.count)
+            if skipped[device_index]:
+                self.writer(device_index).hold(frame_rate, frame.count)
+                continue
+            self.writer(device_index).submit(frame_rate, frame.array, frame.count, copy=False,
+                                             on_done=lambda frame=frame: done(frame))
+
+    def release_frame(self, frame):
+        self.pool.release(frame)
+
+    def _record(self, device_index, frame_rate, frame, point_count):
+        if self.recorder is not None:
+            self.recorder.record(device_index, frame_rate, frame, point_count)
+
     def write_frame(self, device_index, frame_rate, frame, point_count):
+        self._record(device_index, frame_rate, frame, point_count)
+        key = self._frame_key(frame_rate, frame, point_count)
+        skipped = (self.barrier is None or not self.async_output) and self._is_playing(device_index, key)
+        self._count(device_index, key, skipped, point_count)
+        if skipped:
+            if self.async_output:
+                self.writer(device_index).hold(frame_rate, point_count)
+            return
+        if self.async_output:
+            self.writer(device_index).submit(frame_rate, frame, point_count)
+            return
+        stage = self.output_stages.get(device_index)
+        if stage is not None:
+            frame = stage.process(frame, point_count)
+            point_count = len(frame)
+        if isinstance(frame, np.ndarray):
+            # Hand the array's own buffer to the DLL, no copy
+            points = as_point_array(frame).ctypes.data_as(ctypes.POINTER(HeliosPoint))
+        else:
+            points = ctypes.pointer(frame)
         while self.lib.GetStatus(device_index) != 1:
             pass
-        self.lib.WriteFrame(device_index, frame_rate, 0, ctypes.pointer(frame), point_count)
+        if self.lib.WriteFrame(device_index, frame_rate, 0, points, point_count) < 0:
+            self.resend(device_index)
 
 
     def close(self):
+        # Stop every writer before joining any, so writers waiting at the frame barrier all get to finish
+        for writer in self.writers.values():
+            writer.queue.put(DacWriter._STOP)
+        for writer in self.writers.values():
+            writer.join()
+        self.writers.clear()
         self.lib.CloseDevices()
 
 
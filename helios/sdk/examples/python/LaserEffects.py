@@ -4,6 +4,8 @@ import math
 import time
 
 from LaserCore import HeliosPoint, Frame, LaserCore
+from PathCompiler import PathCompiler
+from Clipping import clip_polylines, viewport
 
 
 class LaserEffect:
@@ -27,6 +29,9 @@ class LaserEffect:
         self.brightness_multiplier = brightness_multiplier
         self.max_x = max_x             
         self.max_y = max_y            
+        self.point_budget = None       # Optional PointBudget used when drawing paths
+        self.dwell_planner = None      # Optional DwellPlanner sizing vertex dwell by corner angle
+        self.travel_planner = None     # Optional TravelPlanner pacing the blanked jumps
        
         
 
@@ -34,6 +39,14 @@ class LaserEffect:
         """Update the frame with new points. This method should be overridden by subclasses."""
         raise NotImplementedError("This method should be overridden by subclasses")
 
+    def draw_paths(self, frame, polylines, **overrides):
+        """Append polylines to the frame using this effect's step, blanking and brightness settings."""
+        PathCompiler.from_effect(self, **overrides).render(frame, polylines)
+
+    def clip_paths(self, polylines, rect=None):
+        """Clip polylines to rect (x_min, y_min, x_max, y_max), by default this effect's 0..max_x/max_y viewport."""
+        return clip_polylines(polylines, viewport(self.max_x, self.max_y) if rect is None else rect)
+
     def apply_to_device(self, device):
         """Send the current frame to the device."""
         device.write_frame(0, self.frame_rate, self.frame.points, self.frame.count)
@@ -6,6 +6,8 @@ Created on Fri May 10 20:52:34 2024
 """
 from LaserCore import HeliosPoint, Frame, LaserCore
 from LaserEffects import LaserEffect
+from PathCompiler import Polyline
+from Clipping import clip_segments, viewport
 
 import numpy as np
 import pyaudio
@@ -78,62 +80,11 @@ class LineTravelEffect(LaserEffect):
     #     return visible_start_x, visible_start_y, visible_end_x, visible_end_y
     
     def calculate_visible_segment(self, start_x, start_y, end_x, end_y):
-        """Calculate intersections with screen boundaries to ensure the line stays within the view."""
-        dx = end_x - start_x
-        dy = end_y - start_y
-        points = []
-    
-        # Functions to check if coordinates are within bounds
-        within_x_bounds = lambda x: 0 <= x <= self.max_x
-        within_y_bounds = lambda y: 0 <= y <= self.max_y
-    
-        # Check intersections with each boundary
-        if dx != 0:
-            # Intersection with left boundary (x=0)
-            t = -start_x / dx
-            y = start_y + t * dy
-            if within_y_bounds(y) and 0 <= t <= 1:
-                points.append((0, y))
-            
-            # Intersection with right boundary (x=max_x)
-            t = (self.max_x - start_x) / dx
-            y = start_y + t * dy
-            if within_y_bounds(y) and 0 <= t <= 1:
-                points.append((self.max_x, y))
-    
-        if dy != 0:
-            # Intersection with top boundary (y=0)
-            t = -start_y / dy
-            x = start_x + t * dx
-            if within_x_bounds(x) and 0 <= t <= 1:
-                points.append((x, 0))
-            
-            # Intersection with bottom boundary (y=max_y)
-            t = (self.max_y - start_y) / dy
-            x = start_x + t * dx
-            if within_x_bounds(x) and 0 <= t <= 1:
-                points.append((x, self.max_y))
-    
-        # Include original points if they are within bounds
-        if within_x_bounds(start_x) and within_y_bounds(start_y):
-            points.append((start_x, start_y))
-        if within_x_bounds(end_x) and within_y_bounds(end_y):
-            points.append((end_x, end_y))
-    
-        # Select the two points that form the longest visible segment
-        if len(points) >= 2:
-            max_dist = 0
-            best_pair = (start_x, start_y, end_x, end_y)
-            for i in range(len(points)):
-                for j in range(i + 1, len(points)):
-                    px, py = points[i]
-                    qx, qy = points[j]
-                    dist = (px - qx) ** 2 + (py - qy) ** 2
-                    if dist > max_dist:
-                        max_dist = dist
-                        best_pair = (px, py, qx, qy)
-            return best_pair
-        return start_x, start_y, end_x, end_y  # Return original line if no intersections are useful
+        """Clip the line to the screen. Returns None when none of it is on screen."""
+        starts, ends, visible = clip_segments((start_x, start_y), (end_x, end_y), viewport(self.max_x, self.max_y))
+        if not visible[0]:
+            return None
+        return (*starts[0], *ends[0])
 
     def update_frame(self, frame, clear=True):
         if clear:
@@ -144,47 +95,13 @@ class LineTravelEffect(LaserEffect):
         end_y = int(self.current_y - self.line_length * math.sin(math.atan2(self.vel_y, self.vel_x)))
     
         # Adjust line endpoints to stay within the visible area
-        visible_start_x, visible_start_y, visible_end_x, visible_end_y = self.calculate_visible_segment(self.current_x, self.current_y, end_x, end_y)
-        
-        visible_start_x = int(max(0, min(self.max_x, visible_start_x)))
-        visible_start_y = int(max(0, min(self.max_y, visible_start_y)))
-        visible_end_x = int(max(0, min(self.max_x, visible_end_x)))
-        visible_end_y = int(max(0, min(self.max_y, visible_end_y)))
-    
-        start_point = HeliosPoint(visible_start_x, visible_start_y, self.point_color[0], self.point_color[1], self.point_color[2])
-        end_point = HeliosPoint(visible_end_x, visible_end_y, self.line_color[0], self.line_color[1], self.line_color[2])
-        
-        
-        
-        # Initial blanking move to the start position
-        start_blank_point = HeliosPoint(visible_start_x, visible_start_y, 0, 0, 0)
-        frame.move_head_to_point(start_blank_point, self.max_step_size)
-        
-        for _ in range(self.starting_blanking_points):
-            frame.add_point(start_blank_point)
-        
-        for _ in range(self.blanking_points):
-            frame.add_point(start_blank_point)
-        
-        for _ in range(self.brightness_multiplier):
-            frame.add_point(start_point)
-            
-        frame.add_line_smooth(start_point, end_point, color=self.line_color, min_step_size=self.min_step_size, max_step_size=self.max_step_size, transition_length=self.transition_length)
-        
-        # Adding a blanking point at the end of the line
-        end_blank_point = HeliosPoint(visible_end_x, visible_end_y, 0, 0, 0)
-        for _ in range(self.blanking_points):
-            frame.add_point(end_blank_point)
-            
-            
-            
-
+        segment = self.calculate_visible_segment(self.current_x, self.current_y, end_x, end_y)
+        if segment is None:
+            return
+        visible_start_x, visible_start_y, visible_end_x, visible_end_y = (int(round(v)) for v in segment)
     
-                
-        
-            
-       
-
+        line = Polyline([(visible_start_x, visible_start_y), (visible_end_x, visible_end_y)], self.point_color, self.line_color)
+        self.draw_paths(frame, [line], travel_step_size=self.max_step_size)
             
             
 #%%
@@ -6,6 +6,7 @@ Created on Fri May 10 20:52:34 2024
 """
 from LaserCore import HeliosPoint, Frame, LaserCore
 from LaserEffects import LaserEffect
+from PathCompiler import Polyline
 
 import numpy as np
 import pyaudio
@@ -163,47 +164,11 @@ class ParticleEffect(LaserEffect):
         if clear:
             frame.clear()
         
-        start_blank_point = HeliosPoint(self.points[0]['pos'][0], self.points[0]['pos'][1], 0, 0, 0)
-        frame.move_head_to_point(start_blank_point, self.min_step_size)
         self.num_points=len(self.points)
-        
-        for _ in range(self.starting_blanking_points):
-            frame.add_point(start_blank_point)
-            
-        for i in range(0, self.num_points-1):
-            
-            current_point = self.points[i % self.num_points]
-            next_point = self.points[(i + 1) % self.num_points]  # wrap around to the start
-            
-            start_point = HeliosPoint(current_point['pos'][0], current_point['pos'][1], self.point_color[0], self.point_color[1], self.point_color[2])
-            end_point = HeliosPoint(next_point['pos'][0], next_point['pos'][1], self.line_color[0], self.line_color[1], self.line_color[2])
-            start_blank_point = HeliosPoint(current_point['pos'][0], current_point['pos'][1], 0, 0, 0)
-            end_blank_point = HeliosPoint(next_point['pos'][0], next_point['pos'][1], 0, 0, 0)
-            
-            
-            for _ in range(self.blanking_points):
-                frame.add_point(start_blank_point)
-            
-            for _ in range(self.brightness_multiplier):
-                frame.add_point(start_point)
-                
-            frame.add_line_smooth(start_point, end_point, color=self.line_color, min_step_size=self.min_step_size, max_step_size=self.max_step_size, transition_length=self.transition_length)
-            
-            for _ in range(self.blanking_points):
-                frame.add_point(end_blank_point)
-                
-        for spark in self.sparks:
-            spark_point = HeliosPoint(int(spark.position[0]), int(spark.position[1]),  self.spark_color[0], self.spark_color[1], self.spark_color[2])
-            spark_point_blank = HeliosPoint(int(spark.position[0]), int(spark.position[1]), 0, 0, 0)
-            frame.move_head_to_point(spark_point_blank, self.min_step_size)
-            for _ in range(self.blanking_points):
-                frame.add_point(start_blank_point)
-            
-            for _ in range(self.brightness_multiplier*2):
-                frame.add_point(start_point)
-            
-            for _ in range(self.blanking_points):
-                frame.add_point(start_blank_point)
+        trail = Polyline([point['pos'] for point in self.points], self.point_color, self.line_color)
+        sparks = [Polyline([(int(spark.position[0]), int(spark.position[1]))], self.spark_color, dwell=self.brightness_multiplier*2)
+                  for spark in self.sparks]
+        self.draw_paths(frame, [trail] + sparks)
                 
 
 class Paddle(LaserEffect):
@@ -240,29 +205,8 @@ class Paddle(LaserEffect):
         if clear:
             frame.clear()
         """Render the paddle as a rectangle on the frame."""
-        start_point = HeliosPoint(self.top_endpoint[0], self.top_endpoint[1], self.point_color[0], self.point_color[1], self.point_color[2])
-        end_point = HeliosPoint(self.bottom_endpoint[0], self.bottom_endpoint[1], self.line_color[0], self.line_color[1], self.line_color[2])
-        start_blank_point = HeliosPoint(self.top_endpoint[0], self.top_endpoint[1], 0, 0, 0)
-        end_blank_point = HeliosPoint(self.bottom_endpoint[0], self.bottom_endpoint[1], 0, 0, 0)
-        
-        for _ in range(self.starting_blanking_points):
-            frame.add_point(start_blank_point)
-            
-        for _ in range(self.blanking_points):
-            frame.add_point(start_blank_point)
-        
-        for _ in range(self.brightness_multiplier):
-            frame.add_point(start_point)
-            
-        frame.add_line_smooth(start_point, end_point, color=self.line_color, min_step_size=self.min_step_size, max_step_size=self.max_step_size, transition_length=self.transition_length)
-        
-        for _ in range(self.blanking_points):
-            frame.add_point(end_blank_point)
-            
-        for _ in range(self.brightness_multiplier):
-            frame.add_point(end_point)
-        
-       
+        paddle = Polyline([self.top_endpoint, self.bottom_endpoint], self.point_color, self.line_color, end_dwell=self.brightness_multiplier)
+        self.draw_paths(frame, [paddle])
 
 
 class PongGame:
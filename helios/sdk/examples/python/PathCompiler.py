@@ -0,0 +1,239 @@
+import numpy as np
+
+from LaserCore import as_point_array, smooth_line_profile
+from PointBudget import LIT, DWELL, BLANKING, resample
+
+
+# Chunk kinds in the compiled point stream
+HOLD = 0      # one point repeated (blanking, dwell)
+TRAVEL = 1    # blanked add_line style move between polylines
+LINE = 2      # add_line_smooth style lit line, end point included
+
+BLANK = (0, 0, 0, 0)
+
+
+class Polyline:
+    """ Geometry an effect wants drawn: vertices plus how to light them.
+
+        points       (N,2) vertex positions. A single vertex is drawn as a dot.
+        point_color  dwell color at each vertex, one (r,g,b,i) tuple or one per vertex
+        line_color   color of the lines, one tuple or one per segment
+        dwell        lit points held at each vertex, one count or one per vertex.
+                     None uses the compiler's brightness_multiplier.
+        end_dwell    points held at the end of every segment in end_color
+        closed       also draw the segment from the last vertex back to the first
+    """
+    def __init__(self, points, point_color=(255,255,255,0), line_color=(0,0,0,0), dwell=None, end_dwell=0, end_color=None, closed=False):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.point_color = point_color
+        self.line_color = line_color
+        self.dwell = dwell
+        self.end_dwell = end_dwell
+        self.end_color = line_color if end_color is None else end_color
+        self.closed = closed
+
+
+def _gather(values, sizes, width=None):
+    """ Concatenate per-polyline values, each given once for the polyline or once per row. """
+    shape = (-1,) if width is None else (-1, width)
+    arrays = [np.asarray(v).reshape(shape) for v in values]
+    if all(len(a) == 1 for a in arrays):
+        return np.repeat(np.concatenate(arrays), sizes, axis=0)
+    return np.concatenate([np.broadcast_to(a, (n,) + a.shape[1:]) for a, n in zip(arrays, sizes)])
+
+
+class PathCompiler:
+    """ Turns a list of Polylines into the frame's point stream in one vectorized pass.
+
+        For every polyline it emits the blanked travel from the current head position, the
+        starting blanking (first polyline only), and then per segment the same sequence the
+        effects used to build by hand: start blanking, vertex dwell, smooth line, end dwell
+        and end blanking.
+
+        With a PointBudget, frames that would not fit are scaled down proportionally instead of
+        being cut off when the frame fills up. With a DwellPlanner, vertices without an explicit
+        dwell get one sized by their corner angle, and the path is drawn through interior vertices
+        without blanking. With a TravelPlanner, jumps between polylines follow the galvos' velocity
+        profile and the blanking held around each jump is sized from its length.
+    """
+    def __init__(self, min_step_size=1, max_step_size=100, transition_length=500, blanking_points=8, start_blanking_points=20, brightness_multiplier=10, travel_step_size=None, budget=None, dwell_planner=None, travel_planner=None):
+        self.min_step_size = min_step_size
+        self.max_step_size = max_step_size
+        self.transition_length = transition_length
+        self.blanking_points = blanking_points
+        self.start_blanking_points = start_blanking_points
+        self.brightness_multiplier = brightness_multiplier
+        self.travel_step_size = min_step_size if travel_step_size is None else travel_step_size
+        self.budget = budget
+        self.dwell_planner = dwell_planner
+        self.travel_planner = travel_planner
+
+    @classmethod
+    def from_effect(cls, effect, **overrides):
+        """ Compiler using a LaserEffect's current step, blanking and brightness settings. """
+        params = dict(min_step_size=effect.min_step_size,
+                      max_step_size=effect.max_step_size,
+                      transition_length=effect.transition_length,
+                      blanking_points=effect.blanking_points,
+                      start_blanking_points=effect.starting_blanking_points,
+                      brightness_multiplier=effect.brightness_multiplier,
+                      budget=effect.point_budget,
+                      dwell_planner=effect.dwell_planner,
+                      travel_planner=effect.travel_planner)
+        params.update(overrides)
+        return cls(**params)
+
+    def _chunks(self, polylines, head):
+        """ Table of chunks (start, end, color, kind, count) for all polylines, in drawing order. """
+        polylines = [line for line in polylines if len(line.points) > 0]
+        if not polylines:
+            return None
+        P = len(polylines)
+        sizes = np.array([len(line.points) for line in polylines])
+        closed = np.array([line.closed for line in polylines])
+        offsets = np.cumsum(sizes) - sizes
+        vertices = np.concatenate([line.points for line in polylines])
+        dwell = _gather([self.brightness_multiplier if line.dwell is None else line.dwell for line in polylines], sizes)
+        point_color = _gather([line.point_color for line in polylines], sizes, 4)
+
+        # Segments of every polyline; single vertices are dots and have none
+        num_segments = np.where(sizes == 1, 0, np.where(closed, sizes, sizes - 1))
+        seg_poly = np.repeat(np.arange(P), num_segments)
+        seg_local = np.arange(len(seg_poly)) - (np.cumsum(num_segments) - num_segments)[seg_poly]
+        s_idx = offsets[seg_poly] + seg_local
+        e_idx = offsets[seg_poly] + (seg_local + 1) % sizes[seg_poly]
+        line_color = _gather([line.line_color for line in polylines], num_segments, 4)
+        end_color = _gather([line.end_color for line in polylines], num_segments, 4)
+        end_dwell = _gather([line.end_dwell for line in polylines], num_segments)
+        start_blanking = end_blanking = self.blanking_points
+        first_seg = seg_local == 0
+        last_seg = seg_local == num_segments[seg_poly] - 1
+
+        if self.dwell_planner is not None:
+            planned, interior = self.dwell_planner.plan(vertices, sizes, closed, self.brightness_multiplier)
+            auto = _gather([line.dwell is None for line in polylines], sizes).astype(bool)
+            dwell = np.where(auto, planned, dwell)
+            # No blanking where the path carries on, and open paths also dwell on their last vertex.
+            # A closed path carries on through its first vertex too, but the beam enters and leaves there
+            start_blanking = np.where(interior[s_idx] & ~first_seg, 0, self.blanking_points)
+            end_blanking = np.where(interior[e_idx] & ~last_seg, 0, self.blanking_points)
+            last = ~closed[seg_poly] & (e_idx == offsets[seg_poly] + sizes[seg_poly] - 1)
+            end_dwell = end_dwell + np.where(last & auto[e_idx], planned[e_idx], 0)
+
+        # Where the beam leaves each polyline, and so where the next travel starts
+        first = vertices[offsets]
+        exit_idx = np.where(closed | (sizes == 1), offsets, offsets + sizes - 1)
+        travel_from = np.concatenate([np.full((1, 2), np.nan) if head is None else np.asarray(head, np.float64).reshape(1, 2),
+                                      vertices[exit_idx[:-1]]])
+        has_travel = ~np.isnan(travel_from[:, 0])
+
+        dots = np.flatnonzero(sizes == 1)
+        dot_points = vertices[offsets[dots]]
+        s, e = vertices[s_idx], vertices[e_idx]
+        blank = np.asarray(BLANK)
+        blanking = self.blanking_points
+        dot_start_blanking = dot_end_blanking = blanking
+        start_blanking_points = self.start_blanking_points
+
+        if self.travel_planner is not None:
+            # Hold after each jump at the polyline's first vertex, and before the next jump at its exit
+            jump = np.nan_to_num(first - travel_from)
+            before, after = self.travel_planner.hold_counts(np.hypot(jump[:, 0], jump[:, 1]))
+            entry = np.where(has_travel, after, blanking)
+            exit_hold = np.append(before[1:], blanking)
+            start_blanking = np.where(first_seg, entry[seg_poly], start_blanking)
+            end_blanking = np.where(last_seg, exit_hold[seg_poly], end_blanking)
+            dot_start_blanking, dot_end_blanking = entry[dots], exit_hold[dots]
+            if has_travel[0]:
+                start_blanking_points = 0
+
+        # (start, end, color, kind, count, polyline, position within the polyline)
+        groups = [
+            (travel_from[has_travel], first[has_travel], blank, TRAVEL, 0, np.flatnonzero(has_travel), 0),
+            (first[:1], first[:1], blank, HOLD, start_blanking_points, np.zeros(1, np.int64), 1),
+            (dot_points, dot_points, blank, HOLD, dot_start_blanking, dots, 2),
+            (dot_points, dot_points, point_color[offsets[dots]], HOLD, dwell[offsets[dots]], dots, 3),
+            (dot_points, dot_points, blank, HOLD, dot_end_blanking, dots, 4),
+            (s, s, blank, HOLD, start_blanking, seg_poly, 2 + 5 * seg_local),
+            (s, s, point_color[s_idx], HOLD, dwell[s_idx], seg_poly, 3 + 5 * seg_local),
+            (s, e, line_color, LINE, 0, seg_poly, 4 + 5 * seg_local),
+            (e, e, end_color, HOLD, end_dwell, seg_poly, 5 + 5 * seg_local),
+            (e, e, blank, HOLD, end_blanking, seg_poly, 6 + 5 * seg_local),
+        ]
+        if start_blanking_points <= 0:
+            del groups[1]
+
+        starts, ends, colors, kinds, counts, polys, locals_ = [], [], [], [], [], [], []
+        for start, end, color, kind, count, poly, local in groups:
+            n = len(start)
+            starts.append(start)
+            ends.append(end)
+            colors.append(np.broadcast_to(color, (n, 4)))
+            kinds.append(np.full(n, kind))
+            counts.append(np.broadcast_to(count, (n,)))
+            polys.append(poly)
+            locals_.append(np.broadcast_to(local, (n,)))
+        order = np.lexsort((np.concatenate(locals_), np.concatenate(polys)))
+        return (np.concatenate(starts)[order], np.concatenate(ends)[order], np.concatenate(colors)[order],
+                np.concatenate(kinds)[order], np.concatenate(counts).astype(np.int64)[order])
+
+    def compile(self, polylines, head=None, available=None):
+        """ Point stream for the polylines as (xs, ys, colors) arrays.
+            head is the (x, y) the beam starts from, or None to skip the first travel move.
+            available limits the budget further, e.g. to the space left in a frame. """
+        table = self._chunks(polylines, head)
+        if table is None:
+            return np.empty(0, np.int64), np.empty(0, np.int64), np.empty((0, 4), np.uint8)
+        start, end, color, kind, count = table
+        delta = end - start
+        distance = np.sqrt(delta[:, 0]**2 + delta[:, 1]**2)
+
+        # Travel moves are stepped like add_line (or planned), lit lines follow the cached smooth profile
+        is_travel = kind == TRAVEL
+        step = self.travel_step_size
+        if self.travel_planner is not None:
+            count[is_travel] = self.travel_planner.travel_counts(distance[is_travel])
+        else:
+            count[is_travel] = np.where(distance[is_travel] > step, np.floor(distance[is_travel] / step), 0)
+        line_chunks = np.flatnonzero(kind == LINE)
+        profiles = [np.append(smooth_line_profile(round(d), self.min_step_size, self.max_step_size, self.transition_length), 1.0)
+                    for d in distance[line_chunks]]
+        count[line_chunks] = [len(f) for f in profiles]
+
+        if self.budget is not None:
+            lit = kind == LINE
+            categories = np.where(lit, LIT, np.where((kind == HOLD) & color[:, :3].any(axis=1), DWELL, BLANKING))
+            count = self.budget.allocate(count, lit, categories, available)
+            profiles = [resample(f, c) for f, c in zip(profiles, count[line_chunks])]
+
+        chunk = np.repeat(np.arange(len(count)), count)
+        offset = np.arange(len(chunk)) - (np.cumsum(count) - count)[chunk]
+        point_kind = kind[chunk]
+
+        fraction = np.zeros(len(chunk))
+        travel = point_kind == TRAVEL
+        if self.travel_planner is not None:
+            fraction[travel] = self.travel_planner.fractions(distance[is_travel], count[is_travel])
+        else:
+            fraction[travel] = (offset[travel] + 1) / count[chunk[travel]]
+        if profiles:
+            fraction[point_kind == LINE] = np.concatenate(profiles)
+
+        xs = np.rint(start[chunk, 0] + fraction * delta[chunk, 0]).astype(np.int64)
+        ys = np.rint(start[chunk, 1] + fraction * delta[chunk, 1]).astype(np.int64)
+        return xs, ys, color[chunk]
+
+    def render(self, frame, polylines):
+        """ Compile the polylines and append them to the frame, travelling from its last point.
+            With a budget, the points already in the frame count against it. """
+        head = None
+        if frame.count > 0:
+            last = as_point_array(frame.points)[frame.count - 1]
+            head = (int(last['x']), int(last['y']))
+        available = frame.size - frame.count
+        if self.budget is not None:
+            # The budget is per frame, so whatever earlier effects drew into it counts too
+            available = max(min(frame.size, self.budget.points) - frame.count, 0)
+        xs, ys, colors = self.compile(polylines, head, available)
+        # When not even the minimums fit, drop the rest here like a full frame would
+        frame.extend(xs[:available], ys[:available], colors[:available])
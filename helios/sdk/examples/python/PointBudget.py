@@ -0,0 +1,90 @@
+import numpy as np
+
+from LaserCore import HELIOS_MAX_POINTS
+
+
+# Point categories the budget reports on
+LIT = 'lit'
+DWELL = 'dwell'
+BLANKING = 'blanking'
+
+
+class BudgetReport:
+    """ What the governor did to one compiled frame. """
+    def __init__(self, budget, requested, emitted, per_category):
+        self.budget = budget
+        self.requested = requested
+        self.emitted = emitted
+        self.per_category = per_category    # category -> (requested, emitted)
+
+    @property
+    def compression(self):
+        """ Fraction of the requested points that were dropped, 0 when nothing had to go. """
+        return 1 - self.emitted / self.requested if self.requested else 0.0
+
+    def __repr__(self):
+        parts = ', '.join(f'{name} {req}->{out}' for name, (req, out) in self.per_category.items())
+        return f'BudgetReport({self.requested}->{self.emitted} of {self.budget}, {self.compression:.0%} compressed: {parts})'
+
+
+class PointBudget:
+    """ Keeps compiled frames within what the DAC can take and still refresh at target_fps.
+
+        The budget is the smaller of max_points (the DAC's HELIOS_MAX_POINTS) and pps / target_fps.
+        When a frame asks for more, every run of points (lit line, dwell, blanking) is scaled
+        down by the same factor, so the frame keeps its proportions instead of being cut off.
+    """
+    def __init__(self, pps=30000, target_fps=None, max_points=HELIOS_MAX_POINTS):
+        self.pps = pps
+        self.target_fps = target_fps
+        self.max_points = max_points
+        self.last_report = None
+
+    @property
+    def points(self):
+        """ Points one frame may use. """
+        if self.target_fps:
+            return max(1, min(self.max_points, int(self.pps // self.target_fps)))
+        return self.max_points
+
+    def allocate(self, counts, minimums, categories, available=None):
+        """ Scale requested run lengths down to fit the budget.
+
+            counts      requested points per run
+            minimums    points a run keeps however tight the budget (e.g. a line's end point)
+            categories  category name of each run, for the report
+            available   space left in the frame, if less than the budget
+        Returns the new counts and stores a BudgetReport in last_report. """
+        counts = np.asarray(counts, dtype=np.int64)
+        minimums = np.minimum(np.asarray(minimums, dtype=np.int64), counts)
+        budget = self.points if available is None else min(self.points, available)
+        requested = int(counts.sum())
+
+        if requested <= budget:
+            allocated = counts
+        elif minimums.sum() >= budget:
+            # Not even the minimums fit, keep those and let the frame drop the rest
+            allocated = minimums
+        else:
+            # Largest remainder apportionment of what is left above the minimums
+            spare = counts - minimums
+            share = spare * (budget - minimums.sum()) / spare.sum()
+            allocated = minimums + np.floor(share).astype(np.int64)
+            leftover = budget - int(allocated.sum())
+            if leftover > 0:
+                allocated[np.argsort(np.floor(share) - share, kind='stable')[:leftover]] += 1
+
+        categories = np.asarray(categories)
+        per_category = {name: (int(counts[categories == name].sum()), int(allocated[categories == name].sum()))
+                        for name in (LIT, DWELL, BLANKING)}
+        self.last_report = BudgetReport(budget, requested, int(allocated.sum()), per_category)
+        return allocated
+
+
+def resample(fractions, count):
+    """ Keep count of the fractions, evenly spread and always including the last one. """
+    n = len(fractions)
+    if count >= n:
+        return fractions
+    index = np.ceil(np.arange(1, count + 1) * n / count).astype(np.int64) - 1
+    return fractions[index]
@@ -0,0 +1,167 @@
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+
+
+# Ordered strokes per edge topology, shared by every renderer drawing that topology
+_stroke_cache = OrderedDict()
+STROKE_CACHE_SIZE = 256
+
+
+def euler_strokes(edges, positions=None):
+    """ Split an edge list into the fewest strokes that draw every edge exactly once.
+
+        Each connected component needs max(1, odd_vertices / 2) strokes. Odd vertices are paired
+        (nearest first when positions are given) with virtual edges, an Euler circuit is walked
+        with Hierholzer's algorithm, and the circuit is cut at the virtual edges.
+        Returns a list of vertex index lists. """
+    adjacency = defaultdict(list)   # vertex -> [(neighbour, edge id)]
+    edge_list = [tuple(edge) for edge in edges]
+    for edge_id, (a, b) in enumerate(edge_list):
+        adjacency[a].append((b, edge_id))
+        adjacency[b].append((a, edge_id))
+    num_real = len(edge_list)
+
+    strokes = []
+    used = [False] * num_real
+    for component in _components(adjacency):
+        odd = [v for v in component if len(adjacency[v]) % 2 == 1]
+        for a, b in _pair_odd_vertices(odd, positions):
+            edge_id = len(used)
+            used.append(False)
+            adjacency[a].append((b, edge_id))
+            adjacency[b].append((a, edge_id))
+
+        start = odd[0] if odd else component[0]
+        steps = _euler_circuit(start, adjacency, used)
+
+        # The circuit is a loop: rotate it to start just after a virtual edge, then cut at each one
+        virtual = [k for k, (_, _, edge_id) in enumerate(steps) if edge_id >= num_real]
+        if virtual:
+            steps = steps[virtual[0] + 1:] + steps[:virtual[0] + 1]
+        stroke = [steps[0][0]] if steps else []
+        for a, b, edge_id in steps:
+            if edge_id >= num_real:
+                if len(stroke) > 1:
+                    strokes.append(stroke)
+                stroke = [b]
+            else:
+                stroke.append(b)
+        if len(stroke) > 1:
+            strokes.append(stroke)
+    return strokes
+
+
+def _components(adjacency):
+    seen = set()
+    components = []
+    for root in adjacency:
+        if root in seen:
+            continue
+        seen.add(root)
+        stack, component = [root], []
+        while stack:
+            v = stack.pop()
+            component.append(v)
+            for w, _ in adjacency[v]:
+                if w not in seen:
+                    seen.add(w)
+                    stack.append(w)
+        components.append(component)
+    return components
+
+
+def _pair_odd_vertices(odd, positions):
+    if positions is None:
+        return list(zip(odd[0::2], odd[1::2]))
+    remaining = list(odd)
+    pairs = []
+    while remaining:
+        a = remaining.pop(0)
+        dists = [np.linalg.norm(positions[a] - positions[b]) for b in remaining]
+        b = remaining.pop(int(np.argmin(dists)))
+        pairs.append((a, b))
+    return pairs
+
+
+def _euler_circuit(start, adjacency, used):
+    """ Iterative Hierholzer walk from start. Returns the circuit as [(from, to, edge id)] steps. """
+    pointer = defaultdict(int)
+    stack = [(start, None, None)]   # (vertex, previous vertex, edge id used to arrive)
+    steps = []
+    while stack:
+        v = stack[-1][0]
+        edges = adjacency[v]
+        while pointer[v] < len(edges) and used[edges[pointer[v]][1]]:
+            pointer[v] += 1
+        if pointer[v] == len(edges):
+            v, previous, edge_id = stack.pop()
+            if edge_id is not None:
+                steps.append((previous, v, edge_id))
+        else:
+            w, edge_id = edges[pointer[v]]
+            used[edge_id] = True
+            stack.append((w, v, edge_id))
+    # Steps come off the stack end-first
+    steps.reverse()
+    return steps
+
+
+def _travel(a, b):
+    return float(np.linalg.norm(a - b))
+
+
+def order_strokes(strokes, positions, max_passes=20):
+    """ Order and orient strokes to shorten the blanked travel between them.
+        Greedy nearest neighbour from the first stroke, then 2-opt over the stroke sequence
+        (reversing a run of strokes also flips each stroke in it). """
+    if len(strokes) < 2:
+        return [list(s) for s in strokes]
+    positions = np.asarray(positions, dtype=np.float64)
+
+    remaining = list(range(1, len(strokes)))
+    route = [list(strokes[0])]
+    while remaining:
+        tail = positions[route[-1][-1]]
+        best, best_dist, best_reversed = None, None, False
+        for k in remaining:
+            for reverse in (False, True):
+                head = strokes[k][-1] if reverse else strokes[k][0]
+                d = _travel(tail, positions[head])
+                if best_dist is None or d < best_dist:
+                    best, best_dist, best_reversed = k, d, reverse
+        remaining.remove(best)
+        route.append(list(reversed(strokes[best])) if best_reversed else list(strokes[best]))
+
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, len(route) - 1):
+            for j in range(i + 1, len(route)):
+                before = positions[route[i - 1][-1]]
+                first, last = positions[route[i][0]], positions[route[j][-1]]
+                after = positions[route[j + 1][0]] if j + 1 < len(route) else None
+                old = _travel(before, first) + (_travel(last, after) if after is not None else 0)
+                new = _travel(before, last) + (_travel(first, after) if after is not None else 0)
+                if new < old - 1e-9:
+                    route[i:j + 1] = [list(reversed(s)) for s in reversed(route[i:j + 1])]
+                    improved = True
+        if not improved:
+            break
+    return route
+
+
+def ordered_strokes(edges, positions):
+    """ Cached strokes for an edge topology, ordered for short travel.
+
+        The cache is keyed on the edges only. Positions are used the first time a topology is
+        seen; pass the 3D vertices of a rigid shape so the order stays valid while it rotates. """
+    key = tuple(tuple(edge) for edge in edges)
+    if key in _stroke_cache:
+        _stroke_cache.move_to_end(key)
+        return _stroke_cache[key]
+    positions = np.asarray(positions, dtype=np.float64)
+    strokes = order_strokes(euler_strokes(key, positions), positions)
+    _stroke_cache[key] = strokes
+    if len(_stroke_cache) > STROKE_CACHE_SIZE:
+        _stroke_cache.popitem(last=False)
+    return strokes
@@ -0,0 +1,86 @@
+import numpy as np
+
+
+class TravelPlanner:
+    """ Sizes blanked jumps from what the projector's galvos can do.
+
+        A jump of d units follows a trapezoidal velocity profile limited by max_velocity
+        (units/s) and max_acceleration (units/s^2), so it takes
+            T = 2*sqrt(d/a)          when it never reaches full speed (d < v^2/a)
+            T = d/v + v/a            otherwise
+        and is sampled with ceil(T * pps) points that bunch up where the mirrors are slow.
+        Before a jump the beam holds blank_delay seconds for the laser to switch off, and after it
+        settle_time plus settle_per_unit seconds per unit of distance for the mirrors to settle.
+
+        All methods take arrays of jumps and work on them in one pass.
+    """
+    def __init__(self, pps=30000, max_velocity=4e6, max_acceleration=8e9, blank_delay=1e-4, settle_time=1e-4, settle_per_unit=1e-7):
+        self.pps = pps
+        self.max_velocity = max_velocity
+        self.max_acceleration = max_acceleration
+        self.blank_delay = blank_delay
+        self.settle_time = settle_time
+        self.settle_per_unit = settle_per_unit
+
+    def _profile(self, distances):
+        """ Acceleration time, peak velocity and total time of each jump. """
+        d = np.asarray(distances, dtype=np.float64)
+        a, v = self.max_acceleration, self.max_velocity
+        accel_time = np.minimum(v / a, np.sqrt(d / a))
+        peak = a * accel_time
+        cruise_time = np.where(peak > 0, (d - peak * accel_time) / np.where(peak > 0, peak, 1), 0)
+        return accel_time, peak, 2 * accel_time + cruise_time
+
+    def jump_time(self, distances):
+        return self._profile(distances)[2]
+
+    def travel_counts(self, distances):
+        """ Points spent moving for each jump. """
+        return np.ceil(self.jump_time(distances) * self.pps - 1e-9).astype(np.int64)
+
+    def hold_counts(self, distances):
+        """ Blank points held before and after each jump; none for jumps of zero length. """
+        d = np.asarray(distances, dtype=np.float64)
+        moving = d > 0
+        before = np.where(moving, np.ceil(self.blank_delay * self.pps), 0).astype(np.int64)
+        after = np.where(moving, np.ceil((self.settle_time + self.settle_per_unit * d) * self.pps), 0).astype(np.int64)
+        return before, after
+
+    def fractions(self, distances, counts):
+        """ Position of every travel point as a fraction of its jump, all jumps back to back.
+            counts can be smaller than travel_counts (e.g. after a PointBudget); the points are
+            then spread evenly over the jump time. Each jump ends exactly on its target. """
+        d = np.asarray(distances, dtype=np.float64)
+        counts = np.asarray(counts, dtype=np.int64)
+        accel_time, peak, total = self._profile(d)
+        jump = np.repeat(np.arange(len(d)), counts)
+        k = np.arange(len(jump)) - (np.cumsum(counts) - counts)[jump] + 1
+        t = total[jump] * k / counts[jump]
+
+        a = self.max_acceleration
+        ta, vp, T, dist = accel_time[jump], peak[jump], total[jump], d[jump]
+        s = np.where(t <= ta, 0.5 * a * t**2,
+                     np.where(t <= T - ta, 0.5 * vp * ta + vp * (t - ta), dist - 0.5 * a * (T - t)**2))
+        return np.where(dist > 0, np.clip(s / np.where(dist > 0, dist, 1), 0, 1), 1.0)
+
+    def plan(self, starts, ends):
+        """ Blanked jumps from starts to ends ((N,2) arrays): the hold before, the move and the hold after.
+            Returns x and y arrays plus the index of the jump each point belongs to. """
+        starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+        ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+        delta = ends - starts
+        distance = np.hypot(delta[:, 0], delta[:, 1])
+        moves = self.travel_counts(distance)
+        before, after = self.hold_counts(distance)
+
+        counts = before + moves + after
+        jump = np.repeat(np.arange(len(distance)), counts)
+        k = np.arange(len(jump)) - (np.cumsum(counts) - counts)[jump]
+        fraction = np.zeros(len(jump))
+        moving = (k >= before[jump]) & (k < (before + moves)[jump])
+        fraction[moving] = self.fractions(distance, moves)
+        fraction[k >= (before + moves)[jump]] = 1.0
+
+        xs = np.rint(starts[jump, 0] + fraction * delta[jump, 0]).astype(np.int64)
+        ys = np.rint(starts[jump, 1] + fraction * delta[jump, 1]).astype(np.int64)
+        return xs, ys, jump
@@ -6,6 +6,9 @@ Created on Fri May 10 20:52:34 2024
 """
 from LaserCore import HeliosPoint, Frame, LaserCore
 from LaserEffects import LaserEffect
+from PathCompiler import Polyline
+from StrokeOrdering import ordered_strokes
+from Clipping import clip_to_planes
 
 import numpy as np
 import pyaudio
@@ -15,11 +18,22 @@ import time
 
 
 class Camera:
-    def __init__(self, position, rotation):
+    def __init__(self, position, rotation, near=1.0):
         self.position = np.array(position)  # Position as (x, y, z)
         self.rotation = np.array(rotation)  # Rotation as (pitch, yaw, roll) in radians
+        self.near = near                    # Closest depth drawn; geometry nearer or behind is clipped
+        self._view_key = None
+        self._view_matrix = None
 
     def get_view_matrix(self):
+        # Rebuilt only when position or rotation changed, including in place (camera.position[2] = ...)
+        key = (tuple(self.position), tuple(self.rotation))
+        if key != self._view_key:
+            self._view_matrix = self._build_view_matrix()
+            self._view_key = key
+        return self._view_matrix
+
+    def _build_view_matrix(self):
         # Create rotation matrices for each axis with 4x4 dimension for homogeneous coordinates
         Rx = np.array([
             [1, 0, 0, 0],
@@ -58,129 +72,256 @@ class Camera:
         return view_matrix
 
     def apply_view_transformation(self, vertices):
-        # Apply view transformation to a list of vertices
-        transformed_vertices = []
+        # All vertices at once as an (N,3) array in camera space
+        vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
         view_matrix = self.get_view_matrix()
-        for vertex in vertices:
-            homogeneous_vertex = np.array([*vertex, 1])  # Convert to homogeneous coordinates
-            transformed_vertex = view_matrix @ homogeneous_vertex
-            transformed_vertices.append(transformed_vertex[:3])
-        return transformed_vertices
-    
+        return vertices @ view_matrix[:3, :3].T + view_matrix[:3, 3]
+
+    def projection_matrix(self, fov=1250, viewer_distance=0):
+        """ 3x4 matrix taking homogeneous world positions to x * fov, -y * fov and the depth
+            viewer_distance + z to divide them by, view transform included. """
+        return np.array([
+            [fov, 0, 0, 0],
+            [0, -fov, 0, 0],
+            [0, 0, 1, viewer_distance]
+        ]) @ self.get_view_matrix()
+
+    def clip_coordinates(self, vertices, fov=1250, viewer_distance=0):
+        """ (N,3) world vertices as (X, Y, W) with the screen position (X/W, Y/W) from the center.
+            The eye is at the origin of these coordinates. """
+        projection = self.projection_matrix(fov, viewer_distance)
+        vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+        return vertices @ projection[:, :3].T + projection[:, 3]
+
+    def project(self, vertices, screen_width, screen_height, fov=1250, viewer_distance=0):
+        """ Screen positions of (N,3) world vertices as an (N,2) int16 array, in one batched pass.
+            Nothing is clipped; vertices near or behind the camera land anywhere. """
+        return self.to_screen(self.clip_coordinates(vertices, fov, viewer_distance), screen_width, screen_height)
+
+    def frustum_planes(self, screen_width, screen_height):
+        """ Half-spaces (a, b, c, d) with a X + b Y + c W + d >= 0 inside the view: in front of the near
+            plane and within the screen on every side. """
+        cx, cy = screen_width // 2, screen_height // 2
+        return np.array([
+            [0, 0, 1, -self.near],
+            [1, 0, cx, 0],
+            [-1, 0, screen_width - cx, 0],
+            [0, 1, cy, 0],
+            [0, -1, screen_height - cy, 0]
+        ], dtype=np.float64)
+
+    def project_strokes(self, clip, strokes, screen_width, screen_height):
+        """ Screen polylines for strokes (vertex index sequences into clip coordinates), with every
+            step clipped to the view frustum before the perspective divide. Steps outside are dropped,
+            steps crossing its sides are trimmed, and strokes are split wherever they leave it.
+            All steps of all strokes are clipped in one batch. """
+        strokes = [np.asarray(stroke, dtype=np.int64) for stroke in strokes if len(stroke) > 1]
+        if not strokes:
+            return []
+        sizes = np.array([len(stroke) for stroke in strokes])
+        flat = np.concatenate(strokes)
+        steps = sizes - 1
+        owner = np.repeat(np.arange(len(strokes)), steps)
+        a = (np.cumsum(sizes) - sizes)[owner] + np.arange(len(owner)) - (np.cumsum(steps) - steps)[owner]
+        starts, ends = clip[flat[a]], clip[flat[a + 1]]
+        t0, t1, visible = clip_to_planes(starts, ends, self.frustum_planes(screen_width, screen_height))
+        delta = ends - starts
+        first = self.to_screen(starts + t0[:, None] * delta, screen_width, screen_height)
+        last = self.to_screen(starts + t1[:, None] * delta, screen_width, screen_height)
+        # A step carries straight on into the next one of its stroke unless either was cut at the shared vertex
+        joined = (visible & (t1 >= 1))[:-1] & (visible & (t0 <= 0))[1:] & (owner[:-1] == owner[1:])
+        runs = np.split(np.arange(len(owner)), np.flatnonzero(~joined) + 1)
+        return [np.concatenate([first[run[:1]], last[run]]) for run in runs if visible[run[0]]]
+
+    @staticmethod
+    def to_screen(clip, screen_width, screen_height):
+        """ Perspective divide of (N,3) projected positions into int16 screen coordinates. """
+        depth = clip[:, 2:]
+        screen = np.divide(clip[:, :2], depth, out=np.zeros((len(clip), 2)), where=depth != 0)
+        screen = np.trunc(screen, out=screen)
+        screen += (screen_width // 2, screen_height // 2)
+        limits = np.iinfo(np.int16)
+        return np.clip(screen, limits.min, limits.max, out=screen).astype(np.int16)
+
+
+def _axis_quaternion(axis, angle):
+    """ Unit quaternion (w, x, y, z) rotating by angle radians about a unit axis. """
+    return np.concatenate([[np.cos(angle / 2)], np.sin(angle / 2) * np.asarray(axis, dtype=np.float64)])
+
+
+def _quaternion_product(a, b):
+    """ The rotation b followed by a. """
+    aw, ax, ay, az = a
+    bw, bx, by, bz = b
+    return np.array([aw * bw - ax * bx - ay * by - az * bz,
+                     aw * bx + ax * bw + ay * bz - az * by,
+                     aw * by - ax * bz + ay * bw + az * bx,
+                     aw * bz + ax * by - ay * bx + az * bw])
+
+
+def _quaternion_matrix(q):
+    """ 3x3 rotation matrix of a unit quaternion, or (S,3,3) matrices of an (S,4) array of them. """
+    q = np.asarray(q, dtype=np.float64)
+    w, v = q[..., 0], q[..., 1:]
+    # R = (w^2 - |v|^2) I + 2 v v^T + 2 w [v]x
+    matrix = 2 * v[..., :, None] * v[..., None, :]
+    matrix += (w * w - (v * v).sum(axis=-1))[..., None, None] * np.eye(3)
+    c = 2 * w[..., None] * v
+    matrix[..., 2, 1] += c[..., 0]
+    matrix[..., 1, 2] -= c[..., 0]
+    matrix[..., 0, 2] += c[..., 1]
+    matrix[..., 2, 0] -= c[..., 1]
+    matrix[..., 1, 0] += c[..., 2]
+    matrix[..., 0, 1] -= c[..., 2]
+    return matrix
+
+
+def _face_table(faces):
+    """ Faces as an (F,K) index array, shorter faces padded by repeating their last vertex. """
+    if not faces:
+        return np.empty((0, 3), dtype=np.int64)
+    width = max(len(face) for face in faces)
+    return np.array([list(face) + [face[-1]] * (width - len(face)) for face in faces], dtype=np.int64)
+
+
+def _newell_normals(points):
+    """ Area-weighted normals of (F,K,3) polygons. Repeated vertices add nothing, so padded and
+        degenerate faces (e.g. quads collapsing to triangles at a sphere's poles) work too. """
+    return np.cross(points, np.roll(points, -1, axis=1)).sum(axis=1)
+
+
+def _outward_faces(vertices, faces, interior=None):
+    """ Faces wound counter-clockwise seen from outside: any face whose normal points towards
+        interior (one point, or one per face; default the origin) is reversed. """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    table = _face_table(faces)
+    points = vertices[table]
+    interior = np.zeros(3) if interior is None else np.asarray(interior, dtype=np.float64)
+    outward = (_newell_normals(points) * (points.mean(axis=1) - interior)).sum(axis=1) >= 0
+    return [list(face) if keep else list(face)[::-1] for face, keep in zip(faces, outward)]
+
+
 class Shape:
-    def __init__(self, vertices, edges, center):
-        self.vertices = vertices  # List of tuples (x, y, z)
+    def __init__(self, vertices, edges, center, faces=None):
         self.edges = edges        # List of tuples (start_vertex_idx, end_vertex_idx)
-        self.center = center
+        self.center = center      # Position of the shape and the point it rotates about
+        # Rest pose relative to the center; rotations only change the orientation quaternion,
+        # so the geometry never drifts however long the shape spins
+        self.rest_vertices = np.array(vertices, dtype=np.float64).reshape(-1, 3) - np.asarray(center, dtype=np.float64)
+        self.rest_vertices.setflags(write=False)
+        # Faces of closed solids as vertex index lists wound counter-clockwise seen from outside, for hidden line removal
+        self.faces = [] if faces is None else [list(face) for face in faces]
+        self._face_data = None
+        self.orientation = np.array([1.0, 0.0, 0.0, 0.0])
         self.rot_rate_x = 0
         self.rot_rate_y = 0
         self.rot_rate_z = 0
+        self._pose = None
+        self._vertices = None
+
+    def model_matrix(self):
+        """ 4x4 transform from the rest pose to world coordinates: the orientation, then the center. """
+        matrix = np.eye(4)
+        matrix[:3, :3] = _quaternion_matrix(self.orientation)
+        matrix[:3, 3] = self.center
+        return matrix
+
+    @property
+    def vertices(self):
+        """ World positions as an (N,3) array, computed in one matmul when the pose has changed. """
+        pose = (tuple(self.orientation), tuple(np.asarray(self.center, dtype=np.float64)))
+        if pose != self._pose:
+            matrix = self.model_matrix()
+            self._vertices = self.rest_vertices @ matrix[:3, :3].T + matrix[:3, 3]
+            self._vertices.setflags(write=False)
+            self._pose = pose
+        return self._vertices
+
+    @vertices.setter
+    def vertices(self, vertices):
+        # Scripts written for the old API assign rotated vertex lists; they become the new rest pose
+        self.rest_vertices = np.array(vertices, dtype=np.float64).reshape(-1, 3) - np.asarray(self.center, dtype=np.float64)
+        self.rest_vertices.setflags(write=False)
+        self.orientation = np.array([1.0, 0.0, 0.0, 0.0])
+        self._pose = None
 
     def project_vertices(self, screen_width, screen_height, camera, fov=1250, viewer_distance=0):
-        # Apply camera transformations
-        transformed_vertices = camera.apply_view_transformation(self.vertices)
-    
-        # Project transformed vertices into 2D coordinates
-        projected_vertices = []
-        for vertex in transformed_vertices:
-            x, y, z = vertex
-            factor = fov / (viewer_distance + z)
-            x_proj = screen_width // 2 + int(x * factor)
-            y_proj = screen_height // 2 - int(y * factor)
-            projected_vertices.append((x_proj, y_proj))
-        return projected_vertices
-    
+        # Camera transformation and perspective projection in one batched pass
+        return camera.project(self.vertices, screen_width, screen_height, fov, viewer_distance)
+
+    def project_edges(self, screen_width, screen_height, camera, fov=1250, viewer_distance=0):
+        """ Screen polylines of the edges, clipped to the view frustum before projection. """
+        clip = camera.clip_coordinates(self.vertices, fov, viewer_distance)
+        return camera.project_strokes(clip, self.edges, screen_width, screen_height)
+
+    def _faces(self):
+        # Padded face table, plus which faces each edge borders as parallel (edge, face) arrays
+        if self._face_data is None:
+            table = _face_table(self.faces)
+            edge_index = {}
+            for i, (a, b) in enumerate(self.edges):
+                edge_index.setdefault((min(a, b), max(a, b)), i)
+            pairs = [(edge_index[key], f) for f, face in enumerate(self.faces)
+                     for key in {(min(a, b), max(a, b)) for a, b in zip(face, face[1:] + face[:1])} if key in edge_index]
+            edge_ids, face_ids = np.array(pairs, dtype=np.int64).reshape(-1, 2).T
+            self._face_data = (table, edge_ids, face_ids)
+        return self._face_data
+
+    def face_normals(self):
+        """ Unit outward normals of the faces in world coordinates. """
+        table, _, _ = self._faces()
+        normals = _newell_normals(self.vertices[table])
+        return normals / np.linalg.norm(normals, axis=1, keepdims=True)
+
+    def face_centers(self):
+        table, _, _ = self._faces()
+        return self.vertices[table].mean(axis=1)
+
+    def front_faces(self, clip):
+        """ Mask of the faces turned towards the viewer, from their vertices in the camera's clip
+            coordinates. The eye is at the origin there, so a face is in front when its outward normal
+            points back at the origin. The screen y flip reverses the winding, hence the sign.
+            Unlike a test on screen positions, this holds for faces reaching behind the camera. """
+        table, _, _ = self._faces()
+        points = np.asarray(clip, dtype=np.float64)[table]
+        return (_newell_normals(points) * points.mean(axis=1)).sum(axis=1) > 0
+
+    def visible_edges(self, clip):
+        """ Mask of the edges left after hidden line removal: edges of front faces, which includes the
+            silhouette, and edges that border no face at all. """
+        _, edge_ids, face_ids = self._faces()
+        front = self.front_faces(clip)
+        return (np.bincount(edge_ids, weights=front[face_ids], minlength=len(self.edges)) > 0) | \
+               (np.bincount(edge_ids, minlength=len(self.edges)) == 0)
+
+    def _rotated(self, vertices, axis, angle, center):
+        center = np.asarray(center, dtype=np.float64)
+        matrix = _quaternion_matrix(_axis_quaternion(axis, angle))
+        turned = (np.asarray(vertices, dtype=np.float64).reshape(-1, 3) - center) @ matrix.T + center
+        return [tuple(vertex) for vertex in turned]
+
+    # The old per-axis helpers. They leave the shape alone and return the vertices turned about
+    # center as a list of (x, y, z); rotate() is what turns the shape itself
     def rotate_x(self, vertices, angle, center):
-        cx, cy, cz = center
-        cos_angle = np.cos(angle)
-        sin_angle = np.sin(angle)
-        matrix = np.array([
-            [1, 0, 0, 0],
-            [0, cos_angle, -sin_angle, 0],
-            [0, sin_angle, cos_angle, 0],
-            [0, 0, 0, 1]
-        ])
-        translation_matrix1 = np.array([
-            [1, 0, 0, -cx],
-            [0, 1, 0, -cy],
-            [0, 0, 1, -cz],
-            [0, 0, 0, 1]
-        ])
-        translation_matrix2 = np.array([
-            [1, 0, 0, cx],
-            [0, 1, 0, cy],
-            [0, 0, 1, cz],
-            [0, 0, 0, 1]
-        ])
-        vertices = [(x, y, z, 1) for x, y, z in vertices]
-        vertices = [np.dot(translation_matrix1, vertex) for vertex in vertices]
-        vertices = [np.dot(matrix, vertex) for vertex in vertices]
-        vertices = [np.dot(translation_matrix2, vertex) for vertex in vertices]
-        return [(x, y, z) for x, y, z, w in vertices]
-    
+        return self._rotated(vertices, (1, 0, 0), angle, center)
+
     def rotate_y(self, vertices, angle, center):
-        cx, cy, cz = center
-        cos_angle = np.cos(angle)
-        sin_angle = np.sin(angle)
-        matrix = np.array([
-            [cos_angle, 0, sin_angle, 0],
-            [0, 1, 0, 0],
-            [-sin_angle, 0, cos_angle, 0],
-            [0, 0, 0, 1]
-        ])
-        translation_matrix1 = np.array([
-            [1, 0, 0, -cx],
-            [0, 1, 0, -cy],
-            [0, 0, 1, -cz],
-            [0, 0, 0, 1]
-        ])
-        translation_matrix2 = np.array([
-            [1, 0, 0, cx],
-            [0, 1, 0, cy],
-            [0, 0, 1, cz],
-            [0, 0, 0, 1]
-        ])
-        vertices = [(x, y, z, 1) for x, y, z in vertices]
-        vertices = [np.dot(translation_matrix1, vertex) for vertex in vertices]
-        vertices = [np.dot(matrix, vertex) for vertex in vertices]
-        vertices = [np.dot(translation_matrix2, vertex) for vertex in vertices]
-        return [(x, y, z) for x, y, z, w in vertices]
-    
+        return self._rotated(vertices, (0, 1, 0), angle, center)
+
     def rotate_z(self, vertices, angle, center):
-        cx, cy, cz = center
-        cos_angle = np.cos(angle)
-        sin_angle = np.sin(angle)
-        matrix = np.array([
-            [cos_angle, -sin_angle, 0, 0],
-            [sin_angle, cos_angle, 0, 0],
-            [0, 0, 1, 0],
-            [0, 0, 0, 1]
-        ])
-        translation_matrix1 = np.array([
-            [1, 0, 0, -cx],
-            [0, 1, 0, -cy],
-            [0, 0, 1, -cz],
-            [0, 0, 0, 1]
-        ])
-        translation_matrix2 = np.array([
-            [1, 0, 0, cx],
-            [0, 1, 0, cy],
-            [0, 0, 1, cz],
-            [0, 0, 0, 1]
-        ])
-        vertices = [(x, y, z, 1) for x, y, z in vertices]
-        vertices = [np.dot(translation_matrix1, vertex) for vertex in vertices]
-        vertices = [np.dot(matrix, vertex) for vertex in vertices]
-        vertices = [np.dot(translation_matrix2, vertex) for vertex in vertices]
-        return [(x, y, z) for x, y, z, w in vertices]
-    
+        return self._rotated(vertices, (0, 0, 1), angle, center)
+
     def rotate(self, angle_x, angle_y, angle_z):
+        """ Turn about the world x, y and z axes through the center, in that order. """
         self.rot_rate_x = angle_x
         self.rot_rate_y = angle_y
         self.rot_rate_z = angle_z
-        self.vertices = self.rotate_x(self.vertices, self.rot_rate_x, self.center)
-        self.vertices = self.rotate_y(self.vertices, self.rot_rate_y, self.center)
-        self.vertices = self.rotate_z(self.vertices, self.rot_rate_z, self.center)
+        q = self.orientation
+        for axis, angle in (((1, 0, 0), angle_x), ((0, 1, 0), angle_y), ((0, 0, 1), angle_z)):
+            if angle:
+                q = _quaternion_product(_axis_quaternion(axis, angle), q)
+        # Renormalize so rounding can't build up into scaling
+        self.orientation = q / np.linalg.norm(q)
 
 
 class Cube(Shape):
@@ -188,7 +329,7 @@ class Cube(Shape):
         # Define vertices relative to the center
         cx, cy, cz = center
         s = size / 2
-        self.vertices = np.array([
+        vertices = np.array([
             [cx + s, cy + s, cz + s], [cx + s, cy + s, cz - s],
             [cx + s, cy - s, cz + s], [cx + s, cy - s, cz - s],
             [cx - s, cy + s, cz + s], [cx - s, cy + s, cz - s],
@@ -201,26 +342,7 @@ class Cube(Shape):
             [0, 4, 6, 2], [1, 5, 7, 3],  # Right and left face
             [0, 4, 5, 1], [2, 6, 7, 3]   # Top and bottom face
         ]
-        super().__init__(self.vertices, self.edges, center)
-
-    def face_normals(self):
-        normals = []
-        for face in self.faces:
-            v0, v1, v2 = self.vertices[face[0]], self.vertices[face[1]], self.vertices[face[2]]
-            # Calculate normal using the cross product of vectors within the face
-            normal = np.cross(np.array(v1) - np.array(v0), np.array(v2) - np.array(v0))
-            normal = normal / np.linalg.norm(normal)  # Normalize the vector
-            normals.append(normal)
-        return normals
-
-    def face_centers(self):
-        centers = []
-        for face in self.faces:
-            # Calculate the centroid of each face
-            face_vertices = np.array(self.vertices)[face]
-            center = np.mean(face_vertices, axis=0)
-            centers.append(center)
-        return np.array(centers)
+        super().__init__(vertices, self.edges, center, _outward_faces(vertices - np.asarray(center), self.faces))
         
         
 class Pyramid(Shape):
@@ -241,7 +363,9 @@ class Pyramid(Shape):
             (0, 1), (1, 2), (2, 3), (3, 0),  # Base
             (0, 4), (1, 4), (2, 4), (3, 4)   # Sides
         ]
-        super().__init__(vertices, edges, center)
+        # Faces: the base and four sides
+        faces = [[0, 1, 2, 3], [0, 1, 4], [1, 2, 4], [2, 3, 4], [3, 0, 4]]
+        super().__init__(vertices, edges, center, _outward_faces(np.array(vertices) - np.asarray(center), faces))
 class Tetrahedron(Shape):
     def __init__(self, center, size):
         cx, cy, cz = center
@@ -253,7 +377,8 @@ class Tetrahedron(Shape):
             (cx, cy + 2*s/np.sqrt(3), cz - s/3)
         ]
         edges = [(0, 1), (0, 2), (0, 3), (1, 2), (2, 3), (3, 1)]
-        super().__init__(vertices, edges, center)
+        faces = [[0, 1, 2], [0, 2, 3], [0, 3, 1], [1, 2, 3]]
+        super().__init__(vertices, edges, center, _outward_faces(np.array(vertices) - np.asarray(center), faces))
 class Octahedron(Shape):
     def __init__(self, center, size):
         # Center coordinates and half-size
@@ -277,7 +402,11 @@ class Octahedron(Shape):
             (2, 4), (4, 3), (3, 5), (5, 2)   # Edges on the base
         ]
 
-        super().__init__(vertices, edges, center)
+        # Faces: the top and bottom vertex each with every neighbouring pair of the base
+        ring = [2, 4, 3, 5]
+        faces = [[tip, ring[k], ring[(k + 1) % 4]] for tip in (0, 1) for k in range(4)]
+
+        super().__init__(vertices, edges, center, _outward_faces(np.array(vertices) - np.asarray(center), faces))
 class Sphere(Shape):
     def __init__(self, center, radius, num_latitudes=10, num_longitudes=20):
         # Center coordinates
@@ -311,7 +440,15 @@ class Sphere(Shape):
             for i in range(num_latitudes):
                 edges.append((i * num_longitudes + j, (i + 1) * num_longitudes + j))
 
-        super().__init__(vertices, edges, center)
+        # Faces: a quad between neighbouring latitudes and longitudes (triangles at the poles, where a ring collapses)
+        faces = []
+        for i in range(num_latitudes):
+            for j in range(num_longitudes):
+                next_j = (j + 1) % num_longitudes
+                faces.append([i * num_longitudes + j, i * num_longitudes + next_j,
+                              (i + 1) * num_longitudes + next_j, (i + 1) * num_longitudes + j])
+
+        super().__init__(vertices, edges, center, _outward_faces(np.array(vertices) - np.asarray(center), faces))
 class Torus(Shape):
     def __init__(self, center, major_radius, minor_radius, num_circles=20, num_sides=20):
         # Center coordinates
@@ -348,7 +485,20 @@ class Torus(Shape):
                 next_circle_index = next_i * num_sides + j
                 edges.append((current_index, next_circle_index))
 
-        super().__init__(vertices, edges, center)
+        # Faces: a quad between neighbouring circles and sides. The torus isn't convex, so each
+        # face is oriented away from the nearest point of the circle running through the tube
+        faces = []
+        for i in range(num_circles):
+            next_i = (i + 1) % num_circles
+            for j in range(num_sides):
+                next_j = (j + 1) % num_sides
+                faces.append([i * num_sides + j, i * num_sides + next_j, next_i * num_sides + next_j, next_i * num_sides + j])
+        rest = np.array(vertices) - np.asarray(center)
+        face_centers = rest[np.array(faces)].mean(axis=1)
+        direction = face_centers[:, :2] / np.linalg.norm(face_centers[:, :2], axis=1, keepdims=True)
+        tube_centers = np.column_stack([direction * major_radius, np.zeros(len(faces))])
+
+        super().__init__(vertices, edges, center, _outward_faces(rest, faces, tube_centers))
 class Star(Shape):
     def __init__(self, center, inner_radius, outer_radius, num_points):
         cx, cy, cz = center
@@ -397,7 +547,7 @@ class Cylinder(Shape):
             top_i = i
             bottom_i = i + num_sides
             next_top_i = (top_i + 1) % num_sides
-            next_bottom_i = (bottom_i + 1) % num_sides if (bottom_i + 1) % num_sides != 0 else num_sides
+            next_bottom_i = (i + 1) % num_sides + num_sides
 
             # Connect top circle points
             edges.append((top_i, next_top_i))
@@ -406,7 +556,11 @@ class Cylinder(Shape):
             # Connect corresponding top and bottom points
             edges.append((top_i, bottom_i))
 
-        super().__init__(vertices, edges, center)
+        # Faces: the two end caps and a quad per side
+        faces = [list(range(num_sides)), list(range(num_sides, 2 * num_sides))]
+        faces += [[i, (i + 1) % num_sides, (i + 1) % num_sides + num_sides, i + num_sides] for i in range(num_sides)]
+
+        super().__init__(vertices, edges, center, _outward_faces(np.array(vertices) - np.asarray(center), faces))
 class Prism(Shape):
     def __init__(self, center, num_sides, radius, height):
         cx, cy, cz = center
@@ -438,10 +592,96 @@ class Prism(Shape):
             # Connect corresponding top and bottom points to form the sides
             edges.append((bottom_i, top_i))
 
-        super().__init__(vertices, edges, center)
+        # Faces: the two polygonal ends and a quad per side
+        faces = [list(range(num_sides)), list(range(num_sides, 2 * num_sides))]
+        faces += [[i, (i + 1) % num_sides, (i + 1) % num_sides + num_sides, i + num_sides] for i in range(num_sides)]
+
+        super().__init__(vertices, edges, center, _outward_faces(np.array(vertices) - np.asarray(center), faces))
         
+class Scene:
+    """ Shapes with parent/child transforms, moved and projected together.
+
+        A child's center and orientation are relative to its parent, so it follows the parent
+        around. All rest poses are stacked into one array once; each frame the model matrices of
+        every shape are composed level by level of the hierarchy, applied to all vertices in one
+        batched product and projected by the camera in one pass. The cost per frame grows with
+        the number of vertices, not the number of shapes.
+    """
+    def __init__(self):
+        self.shapes = []
+        self.parents = []         # Index of each shape's parent, -1 for top level shapes
+        self._layout = None
+        self._poses = None
+
+    def add(self, shape, parent=None):
+        """ Add a shape, optionally as a child of a shape already in the scene. Returns the shape. """
+        self.parents.append(-1 if parent is None else self.shapes.index(parent))
+        self.shapes.append(shape)
+        self._layout = None
+        return shape
+
+    def _stacked(self):
+        # Rest poses back to back, which shape each vertex belongs to, and where each shape starts.
+        # Assigning a shape's vertices replaces its rest pose array, which calls for a new stack
+        poses = [id(shape.rest_vertices) for shape in self.shapes]
+        if self._layout is None or poses != self._poses:
+            self._poses = poses
+            sizes = np.array([len(shape.rest_vertices) for shape in self.shapes], dtype=np.int64)
+            rest = np.concatenate([shape.rest_vertices for shape in self.shapes]) if self.shapes else np.empty((0, 3))
+            owner = np.repeat(np.arange(len(sizes)), sizes)
+            parents = np.array(self.parents, dtype=np.int64)
+            depth = np.zeros(len(parents), dtype=np.int64)
+            for i, parent in enumerate(parents):
+                # Parents are always added before their children
+                depth[i] = 0 if parent < 0 else depth[parent] + 1
+            levels = [np.flatnonzero(depth == level) for level in range(depth.max() + 1 if len(depth) else 0)]
+            self._layout = (rest, owner, np.concatenate([[0], np.cumsum(sizes)]), parents, levels)
+        return self._layout
+
+    def world_matrices(self):
+        """ (S,4,4) transforms from each shape's rest pose to world coordinates. """
+        _, _, _, parents, levels = self._stacked()
+        matrices = np.zeros((len(self.shapes), 4, 4))
+        matrices[:, :3, :3] = _quaternion_matrix(np.array([shape.orientation for shape in self.shapes]).reshape(-1, 4))
+        matrices[:, :3, 3] = np.array([shape.center for shape in self.shapes], dtype=np.float64).reshape(-1, 3)
+        matrices[:, 3, 3] = 1
+        for level in levels[1:]:
+            matrices[level] = matrices[parents[level]] @ matrices[level]
+        return matrices
+
+    def _transform(self, matrices):
+        """ Every vertex through the (S,R,4) matrix of its shape, as one (N,R) array. """
+        rest, owner, _, _, _ = self._stacked()
+        # Column by column, so no per-vertex matrices are gathered
+        columns = np.transpose(matrices, (2, 0, 1))[:, owner]
+        return rest[:, 0:1] * columns[0] + rest[:, 1:2] * columns[1] + rest[:, 2:3] * columns[2] + columns[3]
+
+    def world_vertices(self):
+        """ World positions of every shape's vertices, back to back as one (N,3) array. """
+        return self._transform(self.world_matrices()[:, :3])
+
+    def clip_coordinates(self, camera, fov=1250, viewer_distance=0):
+        """ Camera clip coordinates of every vertex in the scene, and the slice of them belonging to
+            each shape. Camera, parents and model are folded into one 3x4 matrix per shape first. """
+        _, _, offsets, _, _ = self._stacked()
+        clip = self._transform(camera.projection_matrix(fov, viewer_distance) @ self.world_matrices())
+        return clip, [slice(start, end) for start, end in zip(offsets[:-1], offsets[1:])]
+
+    def project(self, camera, screen_width, screen_height, fov=1250, viewer_distance=0):
+        """ Screen positions of every vertex in the scene, and the slice of them belonging to each shape. """
+        clip, slices = self.clip_coordinates(camera, fov, viewer_distance)
+        return camera.to_screen(clip, screen_width, screen_height), slices
+
+    def render(self, frame, effects, camera, clear=True):
+        """ Transform the whole scene once and let each ShapeRendererEffect draw its shape from it, in order. """
+        clip, slices = self.clip_coordinates(camera)
+        for effect in effects:
+            effect.update_frame(frame, clear, camera, clip[slices[self.shapes.index(effect.shape)]])
+            clear = False
+
+
 class ShapeRendererEffect(LaserEffect):
-    def __init__(self, shape, point_color=(255, 0, 0, 0), line_color=(0,0,0,0), point_brightness=5, blanking_points=1, max_x=0xFFF, max_y=0xFFF): #brightness 3 blanking 13 is good
+    def __init__(self, shape, point_color=(255, 0, 0, 0), line_color=(0,0,0,0), point_brightness=5, blanking_points=1, max_x=0xFFF, max_y=0xFFF, optimize_order=True, hidden_lines=False): #brightness 3 blanking 13 is good
         super().__init__(frame_size=1000, 
                             min_step=5, 
                             max_step=150, 
@@ -457,48 +697,56 @@ class ShapeRendererEffect(LaserEffect):
         self.line_color = line_color
         
         self.shape = shape
+        self.optimize_order = optimize_order  # Chain edges into strokes to cut blanked travel
+        self.hidden_lines = hidden_lines      # Leave out edges of faces turned away (shapes with faces only)
+        self._stroke_edges = (None, None)     # Strokes and the edge index of each of their steps
     
     
             
 
-    def update_frame(self, frame, clear, camera):
+    def update_frame(self, frame, clear, camera, clip_vertices=None):
         
         if clear:
             frame.clear()
         
 
-            
-        projected_vertices = self.shape.project_vertices(self.max_x, self.max_y, camera)
-        
-        current_point = (max(0, min(self.max_x, projected_vertices[0][0])), max(0, min(self.max_y, projected_vertices[0][1])))
-        start_blank_point = HeliosPoint(current_point[0], current_point[1], 0, 0, 0)
-        frame.move_head_to_point(start_blank_point, self.min_step_size)
-        
-        
-        for _ in range(self.starting_blanking_points):
-            frame.add_point(start_blank_point)
+        # A Scene hands in the shape's vertices already transformed together with the others
+        if clip_vertices is None:
+            clip_vertices = camera.clip_coordinates(self.shape.vertices)
         
+        if self.optimize_order:
+            strokes = ordered_strokes(self.shape.edges, self.shape.vertices)
+        else:
+            strokes = self.shape.edges
+        if self.hidden_lines and self.shape.faces:
+            strokes = self.visible_strokes(strokes, self.shape.visible_edges(clip_vertices))
         
-        for start_idx, end_idx in self.shape.edges:
-            current_point = (max(0, min(self.max_x, projected_vertices[start_idx][0])), max(0, min(self.max_y, projected_vertices[start_idx][1])))
-            next_point = (max(0, min(self.max_x, projected_vertices[end_idx][0])), max(0, min(self.max_y, projected_vertices[end_idx][1])))
-            
-            start_point = HeliosPoint(current_point[0], current_point[1], self.point_color[0], self.point_color[1], self.point_color[2])
-            end_point = HeliosPoint(next_point[0], next_point[1], self.line_color[0], self.line_color[1], self.line_color[2])
-            start_blank_point = HeliosPoint(current_point[0], current_point[1], 0, 0, 0)
-            end_blank_point = HeliosPoint(next_point[0], next_point[1], 0, 0, 0)
-            
-            frame.move_head_to_point(start_blank_point, self.max_step_size)
-            for _ in range(self.blanking_points):
-                frame.add_point(start_blank_point)
-            
-            for _ in range(self.brightness_multiplier):
-                frame.add_point(start_point)
-                
-            frame.add_line_smooth(start_point, end_point, color=self.line_color, min_step_size=self.min_step_size, max_step_size=self.max_step_size, transition_length=self.transition_length)
-
-            for _ in range(self.blanking_points):
-                frame.add_point(end_blank_point)
+        # Edges are cut to the view frustum before projection, so nothing near or behind the
+        # camera blows up and nothing off screen is squashed onto the border
+        paths = [Polyline(points, self.point_color, self.line_color)
+                 for points in camera.project_strokes(clip_vertices, strokes, self.max_x, self.max_y)]
+        self.draw_paths(frame, paths, travel_step_size=self.max_step_size)
+
+    def visible_strokes(self, strokes, visible):
+        """ Strokes cut wherever they run along an edge that is not visible. """
+        if self._stroke_edges[0] is not strokes:
+            index = {}
+            for i, (a, b) in enumerate(self.shape.edges):
+                index.setdefault((min(a, b), max(a, b)), i)
+            steps = [np.array([index[(min(a, b), max(a, b))] for a, b in zip(stroke[:-1], stroke[1:])], dtype=np.int64)
+                     for stroke in strokes]
+            self._stroke_edges = (strokes, steps)
+        result = []
+        for stroke, steps in zip(strokes, self._stroke_edges[1]):
+            keep = visible[steps]
+            if keep.all():
+                result.append(stroke)
+                continue
+            # Runs of visible steps, each from its first vertex to the vertex after its last step
+            edges = np.diff(np.concatenate([[False], keep, [False]]).astype(np.int8))
+            for start, end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+                result.append(stroke[start:end + 1])
+        return result
     
             
             
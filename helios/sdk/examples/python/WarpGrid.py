@@ -0,0 +1,110 @@
+import numpy as np
+
+
+def _cubic_weights(size, count):
+    """ (size, count) matrix resampling count evenly spaced samples to size with Catmull-Rom
+        cubic convolution. The samples are extended linearly past both ends, so straight
+        lines (and so an identity grid) come out exactly. """
+    position = np.linspace(0, count - 1, size)
+    base = np.minimum(np.floor(position).astype(np.int64), count - 2)
+    t = position - base
+    # Catmull-Rom weights for the samples at base-1, base, base+1, base+2
+    taps = np.stack([
+        (-t**3 + 2 * t**2 - t) / 2,
+        (3 * t**3 - 5 * t**2 + 2) / 2,
+        (-3 * t**3 + 4 * t**2 + t) / 2,
+        (t**3 - t**2) / 2,
+    ], axis=1)
+    # Linear extension: sample -1 is 2*s0 - s1 and sample count is 2*s[count-1] - s[count-2]
+    extend = np.zeros((count + 2, count))
+    extend[1:-1] = np.eye(count)
+    extend[0, :2] = (2, -1)
+    extend[-1, -2:] = (-1, 2)
+    weights = np.zeros((size, count + 2))
+    rows = np.repeat(np.arange(size), 4)
+    np.add.at(weights, (rows, (base[:, None] + np.arange(4)).reshape(-1)), taps.reshape(-1))
+    return weights @ extend
+
+
+class WarpGrid:
+    """ Geometric correction for one projector, baked into a dense lookup table.
+
+        table[j, k] is where the input point (k * step, j * step) should land, with step =
+        max_value / (size - 1). Frames are warped with bilinear interpolation in the table, so the
+        cost per frame doesn't depend on how the warp was defined. Build one from a control grid,
+        four corners (keystone) or a radial coefficient (pincushion / barrel).
+    """
+    def __init__(self, table, max_value=0xFFF):
+        self.table = np.ascontiguousarray(table, dtype=np.float32)
+        if self.table.ndim != 3 or self.table.shape[0] != self.table.shape[1] or self.table.shape[2] != 2:
+            raise ValueError('Warp tables must have shape (size, size, 2)')
+        self.max_value = max_value
+        self.size = self.table.shape[0]
+        self.scale = (self.size - 1) / max_value
+        # x and y tables flattened, for gathering all four corners of every point at once
+        self._x = self.table[:, :, 0].reshape(-1)
+        self._y = self.table[:, :, 1].reshape(-1)
+
+    @classmethod
+    def from_control_grid(cls, control, size=129, max_value=0xFFF):
+        """ Warp through a (rows, columns, 2) grid of output positions for evenly spaced input
+            positions covering 0..max_value, smoothly interpolated with cubic convolution. """
+        control = np.asarray(control, dtype=np.float64)
+        rows = _cubic_weights(size, control.shape[0])
+        columns = _cubic_weights(size, control.shape[1])
+        table = np.stack([rows @ control[:, :, c] @ columns.T for c in range(2)], axis=2)
+        return cls(table, max_value)
+
+    @classmethod
+    def from_corners(cls, corners, size=129, max_value=0xFFF):
+        """ Keystone correction: the projective warp taking the corners of the output square to
+            corners, given as (x, y) for bottom-left, bottom-right, top-right and top-left. """
+        src = np.array([(0, 0), (1, 0), (1, 1), (0, 1)], dtype=np.float64)
+        dst = np.asarray(corners, dtype=np.float64) / max_value
+        # Solve for the homography with h33 = 1
+        A, b = [], []
+        for (u, v), (x, y) in zip(src, dst):
+            A.append([u, v, 1, 0, 0, 0, -u * x, -v * x])
+            A.append([0, 0, 0, u, v, 1, -u * y, -v * y])
+            b += [x, y]
+        H = np.append(np.linalg.solve(np.array(A), np.array(b)), 1).reshape(3, 3)
+        u, v = np.meshgrid(np.linspace(0, 1, size), np.linspace(0, 1, size))
+        w = H[2, 0] * u + H[2, 1] * v + H[2, 2]
+        x = (H[0, 0] * u + H[0, 1] * v + H[0, 2]) / w
+        y = (H[1, 0] * u + H[1, 1] * v + H[1, 2]) / w
+        return cls(np.stack([x, y], axis=2) * max_value, max_value)
+
+    @classmethod
+    def from_radial(cls, k, size=129, max_value=0xFFF, center=None):
+        """ Radial correction r' = r * (1 + k * r^2), with r relative to the half width.
+            A negative k pulls the edges in to cancel pincushion distortion, a positive one cancels barrel. """
+        center = np.full(2, max_value / 2) if center is None else np.asarray(center, dtype=np.float64)
+        u, v = np.meshgrid(np.linspace(0, max_value, size), np.linspace(0, max_value, size))
+        du, dv = (u - center[0]) / (max_value / 2), (v - center[1]) / (max_value / 2)
+        factor = 1 + k * (du**2 + dv**2)
+        return cls(np.stack([center[0] + du * factor * max_value / 2, center[1] + dv * factor * max_value / 2], axis=2), max_value)
+
+    def map(self, xs, ys):
+        """ Warped float positions for arrays of input positions. """
+        gx = np.clip(np.asarray(xs, dtype=np.float32) * np.float32(self.scale), 0, self.size - 1)
+        gy = np.clip(np.asarray(ys, dtype=np.float32) * np.float32(self.scale), 0, self.size - 1)
+        x0 = np.minimum(gx.astype(np.int32), self.size - 2)
+        y0 = np.minimum(gy.astype(np.int32), self.size - 2)
+        fx, fy = gx - x0, gy - y0
+        i00 = y0 * self.size + x0
+        i01 = i00 + self.size
+        results = []
+        for table in (self._x, self._y):
+            a, b, c, d = table[i00], table[i00 + 1], table[i01], table[i01 + 1]
+            top = a + fx * (b - a)
+            results.append(top + fy * (c + fx * (d - c) - top))
+        return results
+
+    def apply(self, points):
+        """ Warp the positions of a HELIOS_POINT_DTYPE array in place. """
+        if len(points) == 0:
+            return points
+        x, y = self.map(points['x'], points['y'])
+        points['x'] = np.clip(np.rint(x), 0, self.max_value)
+        points['y'] = np.clip(np.rint(y), 0, self.max_value)
+        return points
@@ -0,0 +1,184 @@
+import numpy as np
+
+# Cell states of the raster
+OUTSIDE = 0
+INSIDE = 1
+EDGE = 2
+
+
+class ZoneMask:
+    """ Polygonal zones where the beam is always blanked, e.g. the audience or a truss.
+
+        The polygons are rasterized once into a resolution x resolution grid over 0..max_value.
+        Cells wholly inside or outside a zone answer for every point that falls in them with a
+        single gather; only points in cells a zone edge passes through are tested against the
+        polygons exactly. Where a lit segment crosses a zone edge a point is inserted on the edge,
+        so the beam goes dark (or comes back) exactly there rather than at the nearest sample.
+
+        Zones are in output coordinates, i.e. after any WarpGrid. Each polygon is filled with the
+        even-odd rule; overlapping polygons add up.
+    """
+    def __init__(self, polygons=(), resolution=256, max_value=0xFFF):
+        self.resolution = resolution
+        self.max_value = max_value
+        self.cell_size = (max_value + 1) / resolution
+        self.polygons = []
+        self.edges = np.empty((0, 4))    # x0, y0, x1, y1 of every polygon edge
+        self.cells = np.zeros((resolution, resolution), dtype=np.uint8)
+        for polygon in polygons:
+            self.add_polygon(polygon)
+
+    def add_polygon(self, points):
+        """ Add a zone given by its (N,2) corner positions. """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(points) < 3:
+            raise ValueError('Zones need at least three corners')
+        self.polygons.append(points)
+        self.edges = np.concatenate([self.edges, np.hstack([points, np.roll(points, -1, axis=0)])])
+        self._rasterize()
+
+    def clear(self):
+        self.polygons = []
+        self.edges = np.empty((0, 4))
+        self.cells[...] = OUTSIDE
+
+    def _rasterize(self):
+        # Mark every cell an edge passes through by sampling the edges at half a cell,
+        # then grow the marking by a cell so corners that are only grazed are caught too
+        start, end = self.edges[:, :2], self.edges[:, 2:]
+        length = np.hypot(*(end - start).T)
+        samples = np.ceil(length / (self.cell_size / 2)).astype(np.int64) + 1
+        edge = np.repeat(np.arange(len(samples)), samples)
+        k = np.arange(len(edge)) - (np.cumsum(samples) - samples)[edge]
+        t = (k / np.maximum(samples - 1, 1)[edge])[:, None]
+        cx, cy = self._cell(*(start[edge] + t * (end - start)[edge]).T)
+        on_edge = np.zeros_like(self.cells, dtype=bool)
+        on_edge[cy, cx] = True
+        grown = on_edge.copy()
+        grown[1:] |= on_edge[:-1]
+        grown[:-1] |= on_edge[1:]
+        on_edge = grown.copy()
+        on_edge[:, 1:] |= grown[:, :-1]
+        on_edge[:, :-1] |= grown[:, 1:]
+
+        # Every other cell is wholly inside or outside, so its center decides
+        centers = (np.arange(self.resolution) + 0.5) * self.cell_size
+        xs, ys = np.meshgrid(centers, centers)
+        inside = self.contains(xs.reshape(-1), ys.reshape(-1)).reshape(self.cells.shape)
+        self.cells = np.where(on_edge, EDGE, np.where(inside, INSIDE, OUTSIDE)).astype(np.uint8)
+
+    def _cell(self, xs, ys):
+        last = self.resolution - 1
+        cx = np.clip((np.asarray(xs) / self.cell_size).astype(np.int64), 0, last)
+        cy = np.clip((np.asarray(ys) / self.cell_size).astype(np.int64), 0, last)
+        return cx, cy
+
+    def contains(self, xs, ys):
+        """ Exact test of arrays of positions against the polygons. """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        inside = np.zeros(xs.shape, dtype=bool)
+        for polygon in self.polygons:
+            crossings = np.zeros(xs.shape, dtype=bool)
+            for (ax, ay), (bx, by) in zip(polygon, np.roll(polygon, -1, axis=0)):
+                if ay == by:
+                    continue
+                # Even-odd rule: count edges crossing the ray to the left of each point
+                straddles = (ay > ys) != (by > ys)
+                crossings ^= straddles & (xs < ax + (ys - ay) * (bx - ax) / (by - ay))
+            inside |= crossings
+        return inside
+
+    def masked(self, xs, ys):
+        """ Mask of the positions inside a zone. """
+        cx, cy = self._cell(xs, ys)
+        state = self.cells[cy, cx]
+        masked = state == INSIDE
+        edge = np.flatnonzero(state == EDGE)
+        if len(edge):
+            masked[edge] = self.contains(np.asarray(xs)[edge], np.asarray(ys)[edge])
+        return masked
+
+    def _intersections(self, starts, ends):
+        """ Where every segment meets every zone edge: t along the segment for each pair, and a mask
+            of the pairs that do meet. """
+        r = ends - starts
+        e0, s = self.edges[:, :2], self.edges[:, 2:] - self.edges[:, :2]
+        denom = r[:, None, 0] * s[None, :, 1] - r[:, None, 1] * s[None, :, 0]
+        w = e0[None, :, :] - starts[:, None, :]
+        safe = np.where(denom == 0, 1, denom)
+        t = (w[..., 0] * s[None, :, 1] - w[..., 1] * s[None, :, 0]) / safe
+        u = (w[..., 0] * r[:, None, 1] - w[..., 1] * r[:, None, 0]) / safe
+        hit = (denom != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+        return t, hit
+
+    def apply(self, points, max_points=None):
+        """ Blank every point of a HELIOS_POINT_DTYPE array that lies in a zone, in place, and split lit
+            segments at zone edges. Returns the array, or a longer copy when points were inserted.
+            max_points caps the length of the result; lit segments that would need splitting past
+            it are blanked whole instead. """
+        if len(points) == 0 or not self.polygons:
+            return points
+        xs, ys = points['x'], points['y']
+        masked = self.masked(xs, ys)
+
+        # The beam travels towards each point in that point's color. A lit step can cross zone
+        # edges even when neither end is in a zone, so test every one near the zones for crossings
+        lit = (points['r'] | points['g'] | points['b']) > 0
+        steps = np.flatnonzero(lit[1:]) + 1
+        low, high = self.edges[:, :2].min(axis=0), self.edges[:, :2].max(axis=0)
+        x0, y0 = xs[steps - 1].astype(np.float64), ys[steps - 1].astype(np.float64)
+        x1, y1 = xs[steps].astype(np.float64), ys[steps].astype(np.float64)
+        near = ((np.minimum(x0, x1) <= high[0]) & (np.maximum(x0, x1) >= low[0]) &
+                (np.minimum(y0, y1) <= high[1]) & (np.maximum(y0, y1) >= low[1]))
+        steps = steps[near]
+        if len(steps) == 0 and not masked.any():
+            return points
+        starts = np.stack([x0[near], y0[near]], axis=1)
+        ends = np.stack([x1[near], y1[near]], axis=1)
+
+        t, hit = self._intersections(starts, ends)
+        hit &= (t > 0) & (t < 1)
+        step, edge = np.nonzero(hit)
+        t = t[step, edge]
+        # Rounding can hide a crossing that grazes a corner; split halfway then
+        hidden = np.flatnonzero((masked[steps] != masked[steps - 1]) & ~hit.any(axis=1))
+        step = np.concatenate([step, hidden])
+        t = np.concatenate([t, np.full(len(hidden), 0.5)])
+        order = np.lexsort((t, step))
+        step, t = step[order], t[order]
+        # A step through a corner meets both edges there
+        distinct = np.ones(len(t), dtype=bool)
+        distinct[1:] = (step[1:] != step[:-1]) | (t[1:] - t[:-1] > 1e-9)
+        step, t = step[distinct], t[distinct]
+
+        dark = masked.copy()
+        if max_points is not None:
+            counts = np.bincount(step, minlength=len(steps))
+            fits = np.cumsum(counts) <= max(max_points - len(points), 0)
+            # No room to split these, so draw them dark rather than through a zone
+            dark[steps[~fits & (counts > 0)]] = True
+            keep = fits[step]
+            step, t = step[keep], t[keep]
+
+        at = steps[step]
+        inserted = points[at]
+        if len(at):
+            # Each inserted point ends a piece of its step that is wholly in or out of the zones,
+            # so the middle of the piece tells whether the beam is dark up to it
+            first = np.ones(len(step), dtype=bool)
+            first[1:] = step[1:] != step[:-1]
+            before = np.where(first, 0, np.roll(t, 1))
+            d = ends[step] - starts[step]
+            middle = starts[step] + ((before + t) / 2)[:, None] * d
+            inside = self.masked(middle[:, 0], middle[:, 1])
+            position = np.clip(np.rint(starts[step] + t[:, None] * d), 0, self.max_value)
+            inserted['x'], inserted['y'] = position[:, 0], position[:, 1]
+            for channel in ('r', 'g', 'b', 'i'):
+                inserted[channel][inside] = 0
+
+        for channel in ('r', 'g', 'b', 'i'):
+            points[channel][dark] = 0
+        if len(at):
+            points = np.insert(points, at, inserted)
+        return points
@@ -0,0 +1,12 @@
+import importlib.util
+import os
+import sys
+import types
+
+# The examples are plain modules next to this folder, not a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Most example scripts import pyaudio at the top whether they use it or not. The definitions
+# under test don't, so an empty module stands in where it isn't installed (e.g. headless CI)
+if importlib.util.find_spec('pyaudio') is None:
+    sys.modules['pyaudio'] = types.ModuleType('pyaudio')
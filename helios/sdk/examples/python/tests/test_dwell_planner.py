@@ -0,0 +1,46 @@
+import numpy as np
+
+from DwellPlanner import DwellPlanner
+
+# An open path: straight on at (1000, 0), a right angle at (2000, 0), doubling back at (2000, 1000)
+OPEN = np.array([(0, 0), (1000, 0), (2000, 0), (2000, 1000), (2000, 0)], dtype=np.float64)
+
+
+def test_corner_dwell_grows_with_the_turning_angle():
+    planner = DwellPlanner(max_dwell=20, min_dwell=2)
+    dwell = planner.corner_dwell(np.radians([0, 5, 45, 90, 135, 180]), 20)
+    assert dwell[0] == dwell[1] == 2
+    assert (np.diff(dwell) >= 0).all()
+    assert dwell[-1] == 20
+
+
+def test_open_path_ends_get_end_dwell_and_corners_their_angle():
+    dwell, interior = DwellPlanner(max_dwell=20, min_dwell=2, end_dwell=7).plan(OPEN, [5], [False], 10)
+    assert list(interior) == [False, True, True, True, False]
+    assert dwell[0] == dwell[4] == 7
+    # Straight through, a right angle, and a full reversal
+    assert dwell[1] == 2
+    assert 2 < dwell[2] < 20
+    assert dwell[3] == 20
+
+
+def test_defaults_follow_the_brightness_multiplier():
+    dwell, _ = DwellPlanner().plan(OPEN, [5], [False], 12)
+    assert dwell[0] == dwell[4] == 12
+    assert dwell[3] == 12
+    assert dwell[1] == 0
+
+
+def test_every_vertex_of_a_closed_path_is_interior():
+    square = np.array([(0, 0), (1000, 0), (1000, 1000), (0, 1000)], dtype=np.float64)
+    dwell, interior = DwellPlanner(max_dwell=20).plan(square, [4], [True], 10)
+    assert interior.all()
+    assert (dwell == dwell[0]).all()
+
+
+def test_paths_in_a_batch_are_planned_separately():
+    square = np.array([(0, 0), (1000, 0), (1000, 1000), (0, 1000)], dtype=np.float64)
+    dwell, interior = DwellPlanner(max_dwell=20, end_dwell=5).plan(np.concatenate([OPEN, square]), [5, 4], [False, True], 10)
+    single, _ = DwellPlanner(max_dwell=20, end_dwell=5).plan(OPEN, [5], [False], 10)
+    assert list(dwell[:5]) == list(single)
+    assert interior[5:].all()
@@ -0,0 +1,40 @@
+import numpy as np
+
+from LaserCore import Frame, HeliosPoint, NumpyFrame, as_point_array
+
+
+def contents(frame):
+    return as_point_array(frame.points)[:frame.count].copy()
+
+
+def draw(frame):
+    frame.add_point(HeliosPoint(10, 20, 1, 2, 3, 4))
+    frame.extend(np.array([100, 200.7]), np.array([300, 400]), [(255, 0, 0, 0), (0, 255, 0, 0)])
+    frame.add_lines(np.array([[0, 0], [1000, 1000]]), np.array([[500, 0], [1000, 2000]]), (0, 0, 255, 0), step_size=50)
+    frame.add_line_smooth(HeliosPoint(0, 0, 0, 0, 0, 0), HeliosPoint(3000, 4000, 0, 0, 0, 0), (9, 9, 9, 9))
+
+
+def test_frame_and_numpy_frame_hold_the_same_points():
+    frame, numpy_frame = Frame(2000), NumpyFrame(2000)
+    draw(frame)
+    draw(numpy_frame)
+    assert frame.count == numpy_frame.count
+    assert (contents(frame) == contents(numpy_frame)).all()
+    assert tuple(contents(frame)[2]) == (200, 400, 0, 255, 0, 0)
+
+
+def test_extend_drops_points_past_the_frame_size():
+    frame = Frame(5)
+    frame.extend(np.arange(8), np.arange(8))
+    assert frame.count == 5
+    assert list(contents(frame)['x']) == [0, 1, 2, 3, 4]
+
+
+def test_add_points_copies_a_point_array():
+    source = NumpyFrame(10)
+    draw_points = np.arange(6)
+    source.extend(draw_points, draw_points * 2, (1, 2, 3, 4))
+    frame = Frame(4)
+    frame.add_points(source.points)
+    assert frame.count == 4
+    assert (contents(frame) == contents(source)[:4]).all()
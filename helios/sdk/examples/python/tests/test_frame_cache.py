@@ -0,0 +1,73 @@
+import numpy as np
+
+from FrameCache import FrameStore, PeriodicFrameCache
+from LaserCore import NumpyFrame
+
+
+class Cycle:
+    """ Draws one point at x = k % period on its k-th frame, and counts its renders. """
+    def __init__(self, period):
+        self.period = period
+        self.k = 0
+        self.renders = 0
+
+    def advance(self):
+        self.k += 1
+
+    def update_frame(self, frame, clear=True):
+        if clear:
+            frame.clear()
+        self.renders += 1
+        frame.extend([self.k % self.period], [0], (255, 0, 0, 0))
+
+
+def ticks_to_lock(effect, **settings):
+    cache = PeriodicFrameCache(effect, store=FrameStore(), **settings)
+    frame = NumpyFrame(10)
+    for tick in range(1, 100):
+        cache.update_frame(frame)
+        assert frame.array['x'][0] == effect.k % effect.period
+        effect.advance()
+        if cache.period is not None:
+            return tick, cache
+    return None, cache
+
+
+def test_period_locks_after_a_whole_period_repeats():
+    ticks, cache = ticks_to_lock(Cycle(5))
+    assert cache.period == 5
+    assert ticks == 10
+
+
+def test_period_one_needs_confirm_repeats():
+    ticks, _ = ticks_to_lock(Cycle(1))
+    assert ticks == 3
+    ticks, _ = ticks_to_lock(Cycle(1), confirm=6)
+    assert ticks == 7
+
+
+def test_locked_frames_are_replayed_and_verified():
+    effect = Cycle(4)
+    _, cache = ticks_to_lock(effect, verify_every=10)
+    frame = NumpyFrame(10)
+    renders = effect.renders
+    for _ in range(20):
+        cache.update_frame(frame)
+        assert frame.array['x'][0] == effect.k % effect.period
+        effect.advance()
+    # Only the verification ticks render
+    assert effect.renders - renders == 2
+
+
+def test_cache_starts_over_when_the_effect_stops_repeating():
+    effect = Cycle(1)
+    _, cache = ticks_to_lock(effect, verify_every=4)
+    frame = NumpyFrame(10)
+    effect.period = 1000
+    seen = []
+    for _ in range(8):
+        cache.update_frame(frame)
+        seen.append(frame.array['x'][0] == effect.k % effect.period)
+        effect.advance()
+    assert cache.period is None
+    assert all(seen[4:])
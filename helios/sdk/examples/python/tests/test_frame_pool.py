@@ -0,0 +1,45 @@
+import pytest
+
+from HeliosSim import HeliosSim
+from LaserCore import FramePool, LaserCore, NumpyFrame
+
+
+def test_releasing_a_frame_twice_is_refused():
+    pool = FramePool(2, 10)
+    frame = pool.acquire()
+    pool.release(frame)
+    with pytest.raises(ValueError):
+        pool.release(frame)
+    assert pool.available() == 2
+
+
+def test_releasing_a_foreign_frame_is_refused():
+    pool = FramePool(2, 10)
+    with pytest.raises(ValueError):
+        pool.release(NumpyFrame(10))
+
+
+def test_pool_is_allocated_on_first_acquire():
+    core = LaserCore('', lib=HeliosSim())
+    assert core._pool is None
+    core.release_frame(core.acquire_frame())
+    assert core.pool.available() == core.pool_size
+    core.close()
+
+
+@pytest.mark.parametrize('submit', ['submit_frame', 'submit_all'])
+def test_frame_returns_to_the_pool_when_a_write_fails(submit, monkeypatch):
+    core = LaserCore('', lib=HeliosSim())
+
+    def broken(*args):
+        raise OSError('USB transfer failed')
+    monkeypatch.setattr(core.lib, 'WriteFrame', broken)
+    frame = core.acquire_frame()
+    frame.extend([0, 100], [0, 100], (255, 0, 0, 0))
+    with pytest.raises(OSError):
+        if submit == 'submit_frame':
+            core.submit_frame(0, 30000, frame)
+        else:
+            core.submit_all(30000, frame)
+    assert core.pool.available() == core.pool_size
+    core.close()
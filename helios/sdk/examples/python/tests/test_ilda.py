@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from Ilda import points_to_ilda, read_ilda, write_ilda
+from LaserCore import HELIOS_POINT_DTYPE
+
+
+def frame(xs, ys, color=(255, 0, 0)):
+    points = np.zeros(len(xs), dtype=HELIOS_POINT_DTYPE)
+    points['x'], points['y'] = xs, ys
+    points['r'], points['g'], points['b'] = color
+    return points
+
+
+@pytest.mark.parametrize('format', [0, 1, 4, 5])
+def test_frames_survive_a_round_trip(tmp_path, format):
+    frames = [frame([0, 0x800, 0xFFF], [0xFFF, 0x800, 0]), frame([10, 20], [30, 40], (0, 0, 0))]
+    path = tmp_path / 'show.ild'
+    write_ilda(path, frames, format)
+    read = read_ilda(path)
+    assert len(read) == 2
+    for written, back in zip(frames, read):
+        assert (back['x'] == written['x']).all() and (back['y'] == written['y']).all()
+    assert (read[1]['r'] == 0).all()
+
+
+def test_positions_past_the_dac_range_are_clamped():
+    records = points_to_ilda(frame([0x1000, 0xFFFF, 0xFFF], [0x2000, 5, 0xFFF]))
+    top = (0xFFF << 4) - 32768
+    assert list(records['x']) == [top, top, top]
+    assert list(records['y']) == [top, (5 << 4) - 32768, top]
+
+
+def test_frames_over_65535_points_are_rejected(tmp_path):
+    path = tmp_path / 'big.ild'
+    with pytest.raises(ValueError):
+        write_ilda(path, [np.zeros(0x10000, dtype=HELIOS_POINT_DTYPE)])
+    assert not path.exists()
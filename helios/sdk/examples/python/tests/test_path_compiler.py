@@ -0,0 +1,31 @@
+import numpy as np
+
+from DwellPlanner import DwellPlanner
+from PathCompiler import PathCompiler, Polyline
+
+SQUARE = [(1000, 1000), (2000, 1000), (2000, 2000), (1000, 2000)]
+
+
+def compile_square(**settings):
+    compiler = PathCompiler(blanking_points=8, start_blanking_points=0, **settings)
+    xs, ys, colors = compiler.compile([Polyline(SQUARE, line_color=(255, 0, 0, 0), closed=True)], head=(0, 0))
+    lit = np.flatnonzero(colors[:, :3].any(axis=1))
+    return xs, ys, lit
+
+
+def test_closed_path_with_dwell_planner_blanks_where_it_starts_and_ends():
+    xs, ys, lit = compile_square(dwell_planner=DwellPlanner())
+    first, last = lit[0], lit[-1]
+    # The travel ends at the first vertex and holds there dark before lighting up
+    assert (xs[first - 8:first] == 1000).all() and (ys[first - 8:first] == 1000).all()
+    # ... and after coming back round to it, holds there dark before the next jump
+    assert len(xs) - 1 - last == 8
+    assert (xs[last + 1:] == 1000).all() and (ys[last + 1:] == 1000).all()
+
+
+def test_dwell_planner_drops_blanking_at_interior_vertices():
+    _, _, planned = compile_square(dwell_planner=DwellPlanner())
+    _, _, plain = compile_square()
+    # Between the first and last lit point the path is drawn without going dark
+    assert (np.diff(planned) == 1).all()
+    assert not (np.diff(plain) == 1).all()
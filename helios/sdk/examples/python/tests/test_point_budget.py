@@ -0,0 +1,38 @@
+from LaserCore import NumpyFrame
+from LaserEffects import LaserEffect
+from PathCompiler import Polyline
+from PointBudget import PointBudget
+
+
+class Square(LaserEffect):
+    def __init__(self, x, budget):
+        super().__init__(max_step=10)
+        self.x = x
+        self.point_budget = budget
+
+    def update_frame(self, frame, clear=True):
+        if clear:
+            frame.clear()
+        x = self.x
+        self.draw_paths(frame, [Polyline([(x, 0), (x + 3000, 0), (x + 3000, 3000), (x, 3000)],
+                                         line_color=(255, 0, 0, 0), closed=True)])
+
+
+def test_budget_is_shared_by_effects_drawing_into_one_frame():
+    budget = PointBudget(pps=30000, target_fps=30)
+    frame = NumpyFrame(10000)
+    effects = [Square(x, budget) for x in (0, 500, 1000)]
+    effects[0].update_frame(frame, clear=True)
+    assert frame.count == budget.points
+    for effect in effects[1:]:
+        effect.update_frame(frame, clear=False)
+    assert frame.count <= budget.points
+
+
+def test_budget_leaves_small_frames_alone():
+    budget = PointBudget(pps=30000, target_fps=30)
+    frame = NumpyFrame(10000)
+    Square(0, None).update_frame(frame)
+    unbudgeted = frame.count
+    Square(0, budget).update_frame(frame)
+    assert frame.count == min(unbudgeted, budget.points)
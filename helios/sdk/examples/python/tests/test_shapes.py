@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+import pytest
+
+
+def load_shapes():
+    """ The definitions of VectorRenderEffect, without the cells below them that open the DAC. """
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'VectorRenderEffect.py')
+    with open(path) as f:
+        source = f.read().split('\n#%%')[0]
+    namespace = {'__name__': 'VectorRenderEffect'}
+    exec(compile(source, path, 'exec'), namespace)
+    return namespace
+
+
+shapes = load_shapes()
+
+CLOSED_SHAPES = [
+    ('Cube', lambda: shapes['Cube']((0, 0, 0), 500)),
+    ('Pyramid', lambda: shapes['Pyramid']((0, 0, 0), 500, 500)),
+    ('Tetrahedron', lambda: shapes['Tetrahedron']((0, 0, 0), 500)),
+    ('Octahedron', lambda: shapes['Octahedron']((0, 0, 0), 500)),
+    ('Sphere', lambda: shapes['Sphere']((0, 0, 0), 500)),
+    ('Torus', lambda: shapes['Torus']((0, 0, 0), 500, 150)),
+    ('Cylinder', lambda: shapes['Cylinder']((0, 0, 0), 300, 600, 12)),
+    ('Prism', lambda: shapes['Prism']((0, 0, 0), 6, 300, 600)),
+]
+
+
+@pytest.mark.parametrize('name, make', CLOSED_SHAPES, ids=[name for name, _ in CLOSED_SHAPES])
+def test_every_edge_borders_a_face(name, make):
+    shape = make()
+    sides = {frozenset(pair) for face in shape.faces for pair in zip(face, face[1:] + face[:1])}
+    faceless = [edge for edge in shape.edges if frozenset(edge) not in sides]
+    assert not faceless
+
+
+def old_rotation(vertices, matrix, center):
+    center = np.asarray(center, dtype=np.float64)
+    return (np.asarray(vertices, dtype=np.float64) - center) @ np.asarray(matrix).T + center
+
+
+def test_per_axis_rotation_helpers_match_the_old_matrices():
+    cube = shapes['Cube']((100, -200, 300), 500)
+    c, s = np.cos(0.3), np.sin(0.3)
+    matrices = {
+        'rotate_x': [[1, 0, 0], [0, c, -s], [0, s, c]],
+        'rotate_y': [[c, 0, s], [0, 1, 0], [-s, 0, c]],
+        'rotate_z': [[c, -s, 0], [s, c, 0], [0, 0, 1]],
+    }
+    for name, matrix in matrices.items():
+        turned = getattr(cube, name)(cube.vertices, 0.3, cube.center)
+        assert np.allclose(turned, old_rotation(cube.vertices, matrix, cube.center))
+
+
+def test_assigning_vertices_replaces_the_pose():
+    cube = shapes['Cube']((100, -200, 300), 500)
+    cube.rotate(0.2, 0, 0)
+    cube.vertices = cube.rotate_y(cube.vertices, 0.3, cube.center)
+    expected = cube.vertices.copy()
+    cube.rotate(0, 0, 0)
+    assert np.allclose(cube.vertices, expected)
+    cube.rotate(0, 0.1, 0)
+    assert not np.allclose(cube.vertices, expected)
+
+
+def test_scene_follows_assigned_vertices():
+    scene = shapes['Scene']()
+    cube = scene.add(shapes['Cube']((0, 0, 0), 500))
+    scene.world_vertices()
+    cube.vertices = cube.rotate_z(cube.vertices, 0.5, cube.center)
+    assert np.allclose(scene.world_vertices(), cube.vertices)
@@ -0,0 +1,44 @@
+import numpy as np
+
+from LaserCore import HELIOS_POINT_DTYPE
+from ZoneMask import ZoneMask
+
+
+def points(xs, ys, r=255):
+    p = np.zeros(len(xs), dtype=HELIOS_POINT_DTYPE)
+    p['x'], p['y'], p['r'], p['i'] = xs, ys, r, 255
+    return p
+
+
+def narrow_zone():
+    return ZoneMask([[(1000, 0), (1050, 0), (1050, 4095), (1000, 4095)]])
+
+
+def test_points_in_zone_are_blanked():
+    out = narrow_zone().apply(points([1020, 2000], [500, 500]))
+    assert out['r'][0] == 0
+    assert out['r'][-1] == 255
+
+
+def test_step_entering_zone_is_split_at_the_edge():
+    out = narrow_zone().apply(points([900, 1020], [500, 500]))
+    assert list(out['x']) == [900, 1000, 1020]
+    assert list(out['r']) == [255, 255, 0]
+
+
+def test_step_jumping_over_zone_is_blanked_inside_it():
+    out = narrow_zone().apply(points([900, 1150], [500, 500]))
+    assert list(out['x']) == [900, 1000, 1050, 1150]
+    # Lit up to the zone, dark through it, lit again after it
+    assert list(out['r']) == [255, 255, 0, 255]
+
+
+def test_dark_steps_are_not_split():
+    out = narrow_zone().apply(points([900, 1150], [500, 500], r=0))
+    assert len(out) == 2
+
+
+def test_no_room_blanks_the_whole_step():
+    out = narrow_zone().apply(points([900, 1150], [500, 500]), max_points=2)
+    assert list(out['x']) == [900, 1150]
+    assert out['r'][1] == 0